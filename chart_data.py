@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from result_cache import make_key
+
+# ========================
+# Chart data layer for the Altair views.
+# Long-format frames are pre-aggregated to one row per (series, period),
+# series longer than the point budget are thinned with LTTB, and the
+# serialized Vega-Lite spec is memoized on the payload contents.
+# ========================
+DEFAULT_MAX_POINTS = 2_000
+SPEC_CACHE_SIZE = 64
+
+
+def aggregate(df, keys, period, values):
+    # Mean of each value column per (keys..., period), sorted by period within each series
+    return (
+        df.groupby([*keys, period], sort=True, observed=True)[values]
+        .mean()
+        .reset_index()
+    )
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and, from each
+    # bucket in between, the point forming the largest triangle with its neighbours
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(df, keys, x, y, max_points=DEFAULT_MAX_POINTS):
+    # Splits the point budget evenly across series; series under their share are untouched
+    groups = df.groupby(keys, sort=False, observed=True) if keys else [((), df)]
+    n_series = max(1, len(groups))
+    budget = max(3, max_points // n_series)
+    if len(df) <= max_points:
+        return df
+    parts = []
+    for _, group in groups:
+        parts.append(group.iloc[lttb_indices(group[x].to_numpy(), group[y].to_numpy(), budget)])
+    return pd.concat(parts, ignore_index=True)
+
+
+def chart_payload(df, keys, x, y, max_points=DEFAULT_MAX_POINTS):
+    # Only the columns the chart encodes, one row per (series, period), within the budget
+    return downsample(aggregate(df, keys, x, [y]), keys, x, y, max_points)
+
+
+def frame_digest(*frames):
+    # Cheap content hash of one or more frames (values and column names)
+    return [
+        [list(map(str, f.columns)), int(pd.util.hash_pandas_object(f, index=False).sum() % (1 << 63))]
+        for f in frames
+    ]
+
+
+_specs = OrderedDict()
+_specs_lock = threading.Lock()
+
+
+def cached_spec(name, frames, build, **params):
+    # Serialized Vega-Lite dict for build(*frames), reused while the data and params match
+    key = make_key(name=name, data=frame_digest(*frames), **params)
+    with _specs_lock:
+        if key in _specs:
+            _specs.move_to_end(key)
+            return _specs[key]
+    spec = build(*frames).to_dict()
+    with _specs_lock:
+        _specs[key] = spec
+        while len(_specs) > SPEC_CACHE_SIZE:
+            _specs.popitem(last=False)
+    return spec
@@ -0,0 +1,71 @@
+import time
+
+from registry_audit import log_revision
+from registry_db import REGISTRY, paused_trigger, refresh_summary
+
+# ========================
+# Credit recomputation after an emission-factor revision.
+# A revision sets a new baseline intensity for one industry. The affected
+# projects are found through the (industry, id) index and updated in id-range
+# batches inside a single transaction, so readers (WAL) keep seeing the old
+# credits until the whole revision commits. Every revision gets a version row.
+# ========================
+BATCH_SIZE = 50_000
+
+
+def recompute_credits(industry, baseline_intensity, registry=REGISTRY, batch_size=BATCH_SIZE, progress=None):
+    # Returns the factor_versions row as a dict. progress(done, total) is called after each batch.
+    start = time.perf_counter()
+    with registry.transaction() as conn:
+        summary = conn.execute(
+            "SELECT project_count, total_credits FROM industry_summary WHERE industry = ?", (industry,)
+        ).fetchone()
+        total, credits_before = summary if summary else (0, 0.0)
+        version = conn.execute(
+            "INSERT INTO factor_versions (industry, baseline_intensity, credits_before) VALUES (?, ?, ?)",
+            (industry, baseline_intensity, credits_before),
+        ).lastrowid
+        lo, hi = conn.execute("SELECT MIN(id), MAX(id) FROM projects WHERE industry = ?", (industry,)).fetchone()
+
+        updated = 0
+        # The per-row summary and audit triggers would multiply the cost of every
+        # update; the summary row is rebuilt once and the revision is logged as one event
+        with paused_trigger(conn, "projects_summary_update"), paused_trigger(conn, "projects_audit_update"):
+            for first in range(lo - 1, hi, batch_size) if lo is not None else ():
+                updated += conn.execute("""
+                    UPDATE projects
+                    SET baseline_intensity = ?,
+                        estimated_credits = ? * output_tonnes - actual_emissions - leakage,
+                        factor_version = ?
+                    WHERE industry = ? AND id > ? AND id <= ?
+                """, (baseline_intensity, baseline_intensity, version, industry, first, first + batch_size)).rowcount
+                if progress:
+                    progress(updated, total)
+            refresh_summary(conn, industry)
+            log_revision(conn, industry, baseline_intensity, version)
+
+        credits_after = conn.execute(
+            "SELECT IFNULL(MAX(total_credits), 0) FROM industry_summary WHERE industry = ?", (industry,)
+        ).fetchone()[0]
+        seconds = time.perf_counter() - start
+        conn.execute(
+            "UPDATE factor_versions SET projects_updated = ?, credits_after = ?, seconds = ? WHERE version = ?",
+            (updated, credits_after, seconds, version),
+        )
+    return {
+        "version": version,
+        "industry": industry,
+        "baseline_intensity": baseline_intensity,
+        "projects_updated": updated,
+        "credits_before": credits_before,
+        "credits_after": credits_after,
+        "seconds": seconds,
+    }
+
+
+def factor_history(registry=REGISTRY, limit=20):
+    # Most recent revisions first
+    with registry.connection() as conn:
+        cur = conn.execute("SELECT * FROM factor_versions ORDER BY version DESC LIMIT ?", (limit,))
+        columns = [c[0] for c in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
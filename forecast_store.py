@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+
+from job_runner import POOL_CONTEXT
+
+# ========================
+# ARIMA forecast store.
+# Each fit is keyed on a fingerprint of (history, order, steps): a change to the
+# history gives a new key, so stale forecasts are never served. Fitted parameters
+# and forecasts are kept in memory and persisted as JSON for later restarts.
+# ========================
+STORE_DIR = os.path.join(".cache", "forecasts")
+BAND_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+ORDER_GRID = [(p, d, q) for p in range(3) for d in range(2) for q in range(3)]
+# What statsmodels raises for an order that cannot be estimated on a history
+ESTIMATION_ERRORS = (ValueError, np.linalg.LinAlgError)
+
+
+def fingerprint(series, order, steps):
+    payload = json.dumps({
+        "index": [str(i) for i in series.index],
+        "values": [float(v) for v in series.values],
+        "order": list(order),
+        "steps": int(steps),
+    })
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ForecastStore:
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self._memory = {}
+        self._lock = threading.Lock()
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+
+    def get(self, series, order=(1, 1, 1), steps=12):
+        # Returns a dict with the forecast (list), fitted params and fit metadata
+        key = fingerprint(series, order, steps)
+        entry = self._lookup(key)
+        if entry is None:
+            entry = fit_forecast(series, order, steps)
+            self._remember(key, entry)
+        return entry
+
+    def forecast(self, series, order=(1, 1, 1), steps=12, future_index=None):
+        entry = self.get(series, order, steps)
+        return pd.Series(entry["forecast"], index=future_index)
+
+    def bands(self, series, order=(1, 1, 1), steps=12, paths=5000, quantiles=BAND_QUANTILES, seed=42):
+        # Percentiles of simulated future paths, shape (len(quantiles), steps).
+        # Only these pre-aggregated bands are kept; the path matrix is discarded.
+        base_key = fingerprint(series, order, steps)
+        key = f"{base_key}-bands-{paths}-{seed}-" + "-".join(f"{q:g}" for q in quantiles)
+        entry = self._lookup(key)
+        if entry is None:
+            paths_matrix = simulate_paths(self.get(series, order, steps), paths, np.random.default_rng(seed))
+            entry = {
+                "quantiles": list(quantiles),
+                "bands": np.quantile(paths_matrix, quantiles, axis=0).tolist(),
+            }
+            self._remember(key, entry)
+        return np.array(entry["bands"])
+
+    def select_orders(self, histories, orders=ORDER_GRID, steps=12, criterion="aic", workers=None, progress=None):
+        # Grid-search (p, d, q) for every sector by AIC or BIC. Fits missing from
+        # the store run concurrently in a process pool (statsmodels is CPU-bound).
+        # progress(done, total) is called as fits complete.
+        # Returns {sector: best entry, plus "candidates" and "search_seconds"}.
+        start = time.perf_counter()
+        fits = {}
+        pending = []
+        for sector, series in histories.items():
+            for order in orders:
+                key = fingerprint(series, order, steps)
+                entry = self._lookup(key)
+                if entry is None:
+                    pending.append((sector, tuple(order), key, series))
+                else:
+                    fits[sector, tuple(order)] = entry
+
+        if workers == 1 or len(pending) <= 1:
+            for done, (sector, order, key, series) in enumerate(pending, start=1):
+                fits[sector, order] = self._fit_and_remember(key, series, order, steps)
+                if progress:
+                    progress(done, len(pending))
+        elif pending:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT) as pool:
+                futures = {pool.submit(fit_forecast, series, order, steps): (sector, order, key)
+                           for sector, order, key, series in pending}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    sector, order, key = futures[future]
+                    try:
+                        entry = future.result()
+                    except ESTIMATION_ERRORS:
+                        entry = None  # order not estimable for this history
+                    if entry is not None:
+                        self._remember(key, entry)
+                    fits[sector, order] = entry
+                    if progress:
+                        progress(done, len(pending))
+
+        selection = {}
+        for sector in histories:
+            candidates = {order: entry for (s, order), entry in fits.items()
+                          if s == sector and entry is not None and np.isfinite(entry[criterion])}
+            if not candidates:
+                raise ValueError(f"No ARIMA order could be fitted for '{sector}'")
+            best = min(candidates, key=lambda order: candidates[order][criterion])
+            selection[sector] = dict(candidates[best], candidates=len(candidates),
+                                     search_seconds=time.perf_counter() - start)
+        return selection
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+        entry = self._load(key)
+        if entry is not None:
+            with self._lock:
+                self._memory[key] = entry
+        return entry
+
+    def _remember(self, key, entry):
+        self._save(key, entry)
+        with self._lock:
+            self._memory[key] = entry
+
+    def _fit_and_remember(self, key, series, order, steps):
+        try:
+            entry = fit_forecast(series, order, steps)
+        except ESTIMATION_ERRORS:
+            return None  # order not estimable for this history
+        self._remember(key, entry)
+        return entry
+
+    def _path(self, key):
+        return os.path.join(self.store_dir, f"{key}.json")
+
+    def _load(self, key):
+        if not self.store_dir or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # corrupt file: refit
+
+    def _save(self, key, entry):
+        if not self.store_dir:
+            return
+        # Write to a temp file and rename, so readers never see a partial file
+        tmp = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._path(key))
+
+
+def fit_forecast(series, order, steps):
+    start = time.perf_counter()
+    # Fit on plain values; callers attach their own future index to the forecast
+    with warnings.catch_warnings():
+        # Short histories make many grid orders warn about convergence or start params
+        warnings.simplefilter("ignore")
+        fit = ARIMA(series.to_numpy(dtype=float), order=tuple(order)).fit()
+    forecast = fit.forecast(steps=steps)
+    return {
+        "order": list(order),
+        "params": [float(v) for v in fit.params],
+        "param_names": list(fit.model.param_names),
+        "aic": float(fit.aic),
+        "bic": float(fit.bic),
+        "forecast": [float(v) for v in forecast],
+        "fit_seconds": time.perf_counter() - start,
+    }
+
+
+def psi_weights(entry, steps):
+    # MA(infinity) weights of the fitted ARIMA, differencing included:
+    # psi_0 = 1, psi_j = theta_j + sum_i phi*_i psi_{j-i}, with phi*(L) = phi(L)(1 - L)^d
+    p, d, q = entry["order"]
+    params = dict(zip(entry["param_names"], entry["params"]))
+    phi = np.r_[1.0, [-params[f"ar.L{i}"] for i in range(1, p + 1)]]
+    for _ in range(d):
+        phi = np.convolve(phi, [1.0, -1.0])
+    theta = np.r_[1.0, [params[f"ma.L{j}"] for j in range(1, q + 1)], np.zeros(steps)]
+    psi = np.zeros(steps)
+    for j in range(steps):
+        psi[j] = theta[j] - sum(phi[i] * psi[j - i] for i in range(1, min(j, len(phi) - 1) + 1))
+    return psi
+
+
+def simulate_paths(entry, paths, rng):
+    # (paths, steps) future values: the point forecast plus each path's shocks
+    # pushed through the psi weights. All paths come from one matrix product.
+    forecast = np.asarray(entry["forecast"])
+    steps = len(forecast)
+    psi = psi_weights(entry, steps)
+    lag = np.arange(steps)[:, None] - np.arange(steps)[None, :]
+    impulse = np.where(lag >= 0, psi[np.clip(lag, 0, None)], 0.0)  # lower-triangular Toeplitz
+    sigma = np.sqrt(dict(zip(entry["param_names"], entry["params"]))["sigma2"])
+    shocks = rng.normal(0.0, sigma, (paths, steps))
+    return forecast[None, :] + shocks @ impulse.T
+
+
+# Shared by every session in the process
+FORECAST_STORE = ForecastStore()
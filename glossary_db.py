@@ -0,0 +1,404 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# ========================
+# Glossary index.
+# carbon_glossary.json is the source of truth; the runtime SQLite DB holds the
+# terms plus an FTS5 index over them (external content, kept in step by
+# triggers). A sync diffs the JSON entries against the stored rows by term and
+# applies only the inserts, updates and deletes, in one transaction; WAL
+# readers keep the previous version until it commits.
+# Partial queries are served from indexes: the unique term key (whole-term
+# prefix), FTS5 prefix indexes (word prefix) and a trigram FTS5 table over
+# terms (substring), never a LIKE scan. Browsing is paged per letter group
+# with keyset cursors on the entry key, and entry bodies are read one at a time.
+# Query results are kept in an in-process LRU keyed on the index version, so a
+# re-ingest that changes the glossary makes every older entry unreachable.
+# ========================
+JSON_PATH = "carbon_glossary.json"      # keep this in your repo (source of truth)
+DB_PATH = "carbon_glossary_runtime.db"  # runtime-only; safe to ignore in Git
+SCHEMA_VERSION = 4
+FIELDS = ["term", "category", "definition", "example", "greenwash_watch"]
+TYPEAHEAD_LIMIT = 20
+PAGE_SIZE = 20
+QUERY_CACHE_SIZE = 1024
+# A-Z groups are ranges of the (case-folded) entry key; "#" is everything else
+LETTER_GROUPS = {letter: [(letter.lower(), chr(ord(letter.lower()) + 1))] for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"}
+LETTER_GROUPS["#"] = [("", "a"), ("{", None)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS glossary(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_key TEXT NOT NULL UNIQUE,
+    term TEXT,
+    category TEXT,
+    definition TEXT,
+    example TEXT,
+    greenwash_watch TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_glossary_category ON glossary(category, entry_key);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS glossary_fts USING fts5(
+    term, definition, example, greenwash_watch,
+    content='glossary', content_rowid='id', prefix='2 3 4'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS glossary_trigram USING fts5(
+    term, content='glossary', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS glossary_ai AFTER INSERT ON glossary BEGIN
+    INSERT INTO glossary_fts(rowid, term, definition, example, greenwash_watch)
+    VALUES (NEW.id, NEW.term, NEW.definition, NEW.example, NEW.greenwash_watch);
+    INSERT INTO glossary_trigram(rowid, term) VALUES (NEW.id, NEW.term);
+END;
+CREATE TRIGGER IF NOT EXISTS glossary_ad AFTER DELETE ON glossary BEGIN
+    INSERT INTO glossary_fts(glossary_fts, rowid, term, definition, example, greenwash_watch)
+    VALUES ('delete', OLD.id, OLD.term, OLD.definition, OLD.example, OLD.greenwash_watch);
+    INSERT INTO glossary_trigram(glossary_trigram, rowid, term) VALUES ('delete', OLD.id, OLD.term);
+END;
+CREATE TRIGGER IF NOT EXISTS glossary_au AFTER UPDATE ON glossary BEGIN
+    INSERT INTO glossary_fts(glossary_fts, rowid, term, definition, example, greenwash_watch)
+    VALUES ('delete', OLD.id, OLD.term, OLD.definition, OLD.example, OLD.greenwash_watch);
+    INSERT INTO glossary_fts(rowid, term, definition, example, greenwash_watch)
+    VALUES (NEW.id, NEW.term, NEW.definition, NEW.example, NEW.greenwash_watch);
+    INSERT INTO glossary_trigram(glossary_trigram, rowid, term) VALUES ('delete', OLD.id, OLD.term);
+    INSERT INTO glossary_trigram(rowid, term) VALUES (NEW.id, NEW.term);
+END;
+
+CREATE TABLE IF NOT EXISTS glossary_meta(key TEXT PRIMARY KEY, value);
+"""
+
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=5, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _init_schema(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        # Older runtime DBs lack entry keys or search indexes: rebuild once, and forget
+        # the source hash so the next sync reloads every entry
+        conn.executescript(f"""
+            BEGIN IMMEDIATE;
+            DROP TABLE IF EXISTS glossary_trigram;
+            DROP TABLE IF EXISTS glossary_fts;
+            DROP TABLE IF EXISTS glossary;
+            {SCHEMA}
+            DELETE FROM glossary_meta WHERE key = 'source_hash';
+            PRAGMA user_version={SCHEMA_VERSION};
+            COMMIT;
+        """)
+
+
+def _source_signature(json_path):
+    info = os.stat(json_path)
+    return f"{info.st_mtime_ns}:{info.st_size}"
+
+
+def _meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM glossary_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def index_version(db_path=DB_PATH):
+    # Increases every time a sync changes the glossary
+    conn = connect(db_path)
+    try:
+        return int(_meta(conn, "index_version", 0))
+    except sqlite3.OperationalError:
+        return 0  # not built yet
+    finally:
+        conn.close()
+
+
+def needs_sync(json_path=JSON_PATH, db_path=DB_PATH):
+    # Used on every page run: file stats only, unless the JSON changed since this process
+    # last checked, in which case the DB's recorded source signature is read once
+    if not os.path.exists(db_path):
+        return True
+    signature = _source_signature(json_path)
+    known = _synced.get(db_path)
+    if known is not None and known[0] == signature:
+        return False
+    conn = connect(db_path)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            return True
+        if _meta(conn, "source_signature") != signature:
+            return True
+        _remember_sync(db_path, signature, int(_meta(conn, "index_version", 0)))
+        return False
+    except sqlite3.OperationalError:
+        return True  # legacy or partial DB
+    finally:
+        conn.close()
+
+
+def normalise(text):
+    # NFKC, case-folded, whitespace collapsed: the form of entry keys and of typed queries
+    return " ".join(unicodedata.normalize("NFKC", str(text or "")).casefold().split())
+
+
+def _entries(data):
+    # {entry_key: field values}; the key is the normalised term, numbered when a term repeats
+    entries = {}
+    for row in data:
+        values = tuple(row.get(f, "") for f in FIELDS)
+        key = base = normalise(values[0])
+        n = 1
+        while key in entries:
+            n += 1
+            key = f"{base}#{n}"
+        entries[key] = values
+    return entries
+
+
+def sync_glossary(json_path=JSON_PATH, db_path=DB_PATH):
+    # Brings the DB in line with the JSON file. Returns counts and the new index version.
+    start = time.perf_counter()
+    with open(json_path, "rb") as f:
+        raw = f.read()
+    signature = _source_signature(json_path)
+    source_hash = hashlib.sha256(raw).hexdigest()
+
+    conn = connect(db_path)
+    try:
+        _init_schema(conn)
+        counts = {"inserted": 0, "updated": 0, "deleted": 0}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Whole-file hash: a touched but unchanged file costs nothing more
+            if _meta(conn, "source_hash") != source_hash:
+                entries = _entries(json.loads(raw.decode("utf-8")))
+                # Entries are compared field by field (tuple equality), which is
+                # cheaper than hashing every entry on each sync
+                current = {row[1]: (row[0], row[2:]) for row in conn.execute(
+                    f"SELECT id, entry_key, {', '.join(FIELDS)} FROM glossary")}
+
+                deletes = [(row_id,) for key, (row_id, _) in current.items() if key not in entries]
+                updates = [(*values, current[key][0]) for key, values in entries.items()
+                           if key in current and current[key][1] != values]
+                inserts = [(key, *values) for key, values in entries.items() if key not in current]
+
+                # Triggers mirror every change into the FTS index
+                conn.executemany("DELETE FROM glossary WHERE id = ?", deletes)
+                conn.executemany(f"UPDATE glossary SET {', '.join(f'{f} = ?' for f in FIELDS)} WHERE id = ?",
+                                 updates)
+                conn.executemany(f"""
+                    INSERT INTO glossary (entry_key, {", ".join(FIELDS)})
+                    VALUES (?, {", ".join("?" * len(FIELDS))})
+                """, inserts)
+                counts = {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes)}
+                if any(counts.values()):
+                    conn.execute("""
+                        INSERT INTO glossary_meta VALUES ('index_version', 1)
+                        ON CONFLICT(key) DO UPDATE SET value = value + 1
+                    """)
+            conn.executemany("INSERT OR REPLACE INTO glossary_meta VALUES (?, ?)",
+                             [("source_hash", source_hash), ("source_signature", signature)])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        version = int(_meta(conn, "index_version", 0))
+    finally:
+        conn.close()
+    _remember_sync(db_path, signature, version)
+    return {**counts, "version": version, "seconds": time.perf_counter() - start}
+
+
+# ========================
+# Query cache
+# ========================
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_synced = {}  # db_path -> (source signature, index version) as last seen by this process
+
+
+def _remember_sync(db_path, signature, version):
+    with _cache_lock:
+        previous = _synced.get(db_path)
+        _synced[db_path] = (signature, version)
+        if previous is not None and previous[1] != version:
+            # Entries for the old version can no longer be hit; free them now
+            for key in [k for k in _cache if k[0] == db_path and k[1] != version]:
+                del _cache[key]
+
+
+def current_version(db_path=DB_PATH):
+    # The index version as of this process's last sync check (a DB read only before the first)
+    known = _synced.get(db_path)
+    return known[1] if known is not None else index_version(db_path)
+
+
+def cached_query(key, compute, db_path=DB_PATH):
+    # compute() remembered under (db_path, index version, *key), least recently used evicted
+    # first. Results are shared between sessions, so callers must not modify them.
+    full_key = (db_path, current_version(db_path), *key)
+    with _cache_lock:
+        if full_key in _cache:
+            _cache.move_to_end(full_key)
+            return _cache[full_key]
+    value = compute()
+    with _cache_lock:
+        _cache[full_key] = value
+        while len(_cache) > QUERY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def categories(db_path=DB_PATH):
+    def read():
+        conn = connect(db_path)
+        try:
+            rows = conn.execute("SELECT DISTINCT category FROM glossary WHERE category IS NOT NULL ORDER BY category")
+            return [category for (category,) in rows]
+        finally:
+            conn.close()
+    return cached_query(("categories",), read, db_path)
+
+
+# ========================
+# Typeahead search
+# ========================
+def _filters(category=None, start_letter=None, use_index=True):
+    # use_index=False keeps the planner on the search index instead of idx_glossary_category
+    sql, params = "", []
+    if category:
+        sql += " AND g.category = ?" if use_index else " AND +g.category = ?"
+        params.append(category)
+    if start_letter:
+        # Range on the unique entry-key index rather than a per-row substr()
+        letter = normalise(start_letter)[:1]
+        sql += " AND g.entry_key >= ? AND g.entry_key < ?"
+        params += [letter, chr(ord(letter) + 1)]
+    return sql, params
+
+
+def typeahead(query, category=None, start_letter=None, limit=TYPEAHEAD_LIMIT, db_path=DB_PATH):
+    # Glossary ids for a partial query, best first: terms starting with the query, terms
+    # with words starting with each query word, terms containing each word, then entries
+    # whose text has words starting with each query word. Every tier is driven by its
+    # index (CROSS JOIN fixes the join order) with its own LIMIT, and tiers stop as soon
+    # as `limit` ids are found.
+    key = normalise(query)
+    words = re.findall(r"\w+", key)
+    if not words:
+        return []
+    prefixes = " ".join(f'"{w}"*' for w in words)
+    substrings = " ".join(f'"{w}"' for w in words if len(w) >= 3)  # trigrams need 3 chars
+    tiers = [
+        ("SELECT g.id FROM glossary g WHERE g.entry_key >= ? AND g.entry_key < ?{} ORDER BY g.entry_key",
+         [key, key + "\U0010ffff"]),
+        ("SELECT g.id FROM glossary_fts f CROSS JOIN glossary g ON g.id = f.rowid WHERE glossary_fts MATCH ?{}",
+         [f"term : ({prefixes})"]),
+        ("SELECT g.id FROM glossary_trigram t CROSS JOIN glossary g ON g.id = t.rowid "
+         "WHERE glossary_trigram MATCH ?{}", [substrings] if substrings else None),
+        ("SELECT g.id FROM glossary_fts f CROSS JOIN glossary g ON g.id = f.rowid WHERE glossary_fts MATCH ?{}",
+         [f"{{definition example greenwash_watch}} : ({prefixes})"]),
+    ]
+    filters, filter_params = _filters(category, start_letter, use_index=False)
+    ids = {}
+    conn = connect(db_path)
+    try:
+        for sql, params in tiers:
+            if params is None:
+                continue
+            for (row_id,) in conn.execute(sql.format(filters) + " LIMIT ?", [*params, *filter_params, limit]):
+                ids.setdefault(row_id, None)
+            if len(ids) >= limit:
+                break
+    finally:
+        conn.close()
+    return list(ids)[:limit]
+
+
+def search(query, category=None, start_letter=None, limit=TYPEAHEAD_LIMIT, db_path=DB_PATH):
+    # (id, term, category) rows for a typed query, best first, cached per normalised query
+    def read():
+        return entry_headers(typeahead(query, category, start_letter, limit, db_path), db_path)
+    return cached_query(("search", normalise(query), category, start_letter, limit), read, db_path)
+
+
+def entry_headers(ids, db_path=DB_PATH):
+    # (id, term, category) for ids, in the order given
+    if not ids:
+        return []
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT id, term, category FROM glossary WHERE id IN ({', '.join('?' * len(ids))})", ids
+        ).fetchall()
+    finally:
+        conn.close()
+    by_id = {row[0]: row for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def entry_body(entry_id, db_path=DB_PATH):
+    # (definition, example, greenwash_watch), loaded when an entry is opened
+    def read():
+        conn = connect(db_path)
+        try:
+            return conn.execute(
+                "SELECT definition, example, greenwash_watch FROM glossary WHERE id = ?", (entry_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+    return cached_query(("body", entry_id), read, db_path)
+
+
+# ========================
+# A-Z browsing
+# ========================
+def _read_letter_page(conn, letter, after, category, limit):
+    filters, params = "", []
+    if category:
+        filters, params = " AND category = ?", [category]
+    rows = []
+    for lo, hi in LETTER_GROUPS[letter]:
+        if after is not None and hi is not None and after >= hi:
+            continue  # the cursor is already past this range
+        where, bounds = ("entry_key > ?", [after]) if after is not None and after >= lo \
+            else ("entry_key >= ?", [lo])
+        if hi is not None:
+            where += " AND entry_key < ?"
+            bounds.append(hi)
+        rows += conn.execute(
+            f"SELECT id, entry_key, term, category FROM glossary WHERE {where}{filters} "
+            "ORDER BY entry_key LIMIT ?",
+            [*bounds, *params, limit + 1 - len(rows)],
+        ).fetchall()
+        if len(rows) > limit:
+            break
+    return rows
+
+
+def letter_pages(cursors, category=None, limit=PAGE_SIZE, db_path=DB_PATH):
+    # cursors: {letter group: entry key the page starts after, or None for the first page}.
+    # Returns {letter group: up to limit + 1 rows of (id, entry_key, term, category)}; an
+    # extra row means there is a next page. Each page is a range read on the entry-key
+    # index (or on (category, entry_key)), so its cost does not grow with the glossary,
+    # and pages are cached one by one so paging through one letter reuses the others.
+    pages = {}
+    conn = None
+    try:
+        for letter, after in cursors.items():
+            def read(letter=letter, after=after):
+                nonlocal conn
+                if conn is None:
+                    conn = connect(db_path)
+                return _read_letter_page(conn, letter, after, category, limit)
+            pages[letter] = cached_query(("letter", letter, after, category, limit), read, db_path)
+    finally:
+        if conn is not None:
+            conn.close()
+    return pages
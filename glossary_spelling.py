@@ -0,0 +1,124 @@
+import re
+import threading
+
+from glossary_db import DB_PATH, cached_query, connect, current_version, normalise
+
+# ========================
+# "Did you mean" for glossary searches.
+# SymSpell-style deletion dictionary: every vocabulary word is stored under
+# each string reachable from it by deleting up to MAX_EDIT_DISTANCE characters.
+# A misspelt word then only needs its own deletes looked up, and the few
+# candidates found are checked with a real edit distance, instead of comparing
+# against the whole vocabulary. The vocabulary comes from the FTS index itself,
+# and the dictionary is rebuilt whenever the index version changes.
+# ========================
+MAX_EDIT_DISTANCE = 2
+MIN_WORD_LENGTH = 3
+SUGGESTION_LIMIT = 3
+
+
+def _deletes(word, distance):
+    # word plus every string obtained by removing up to `distance` characters
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a, b, limit=MAX_EDIT_DISTANCE):
+    # Damerau-Levenshtein (optimal string alignment); returns limit + 1 once it is exceeded
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def _allowed_distance(word):
+    # Short words get one edit, or almost everything would be a suggestion
+    return 1 if len(word) <= 4 else MAX_EDIT_DISTANCE
+
+
+class SpellIndex:
+    def __init__(self, words):
+        # words: {word: number of glossary entries containing it}
+        self.words = words
+        self.deletes = {}
+        for word in words:
+            for d in _deletes(word, _allowed_distance(word)):
+                self.deletes.setdefault(d, []).append(word)
+
+    def lookup(self, word, limit=SUGGESTION_LIMIT):
+        # Closest vocabulary words, nearest first, then most common
+        if word in self.words:
+            return [word]
+        allowed = _allowed_distance(word)
+        candidates = set()
+        for d in _deletes(word, allowed):
+            candidates.update(self.deletes.get(d, ()))
+        scored = []
+        for candidate in candidates:
+            distance = edit_distance(word, candidate, allowed)
+            if distance <= allowed:
+                scored.append((distance, -self.words[candidate], candidate))
+        return [candidate for _, _, candidate in sorted(scored)[:limit]]
+
+
+def _load_vocabulary(db_path):
+    conn = connect(db_path)
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.glossary_vocab USING fts5vocab(main, glossary_fts, 'row')")
+        rows = conn.execute("SELECT term, doc FROM temp.glossary_vocab WHERE length(term) >= ?", (MIN_WORD_LENGTH,))
+        return {word: docs for word, docs in rows if word.isalpha()}
+    finally:
+        conn.close()
+
+
+_INDEXES = {}  # db_path -> (index version, SpellIndex)
+_LOCK = threading.Lock()
+
+
+def spelling_index(db_path=DB_PATH):
+    # The deletion dictionary for the current index version, built on first use after a sync
+    version = current_version(db_path)
+    with _LOCK:
+        cached = _INDEXES.get(db_path)
+        if cached is None or cached[0] != version:
+            cached = (version, SpellIndex(_load_vocabulary(db_path)))
+            _INDEXES[db_path] = cached
+    return cached[1]
+
+
+def suggest(query, limit=SUGGESTION_LIMIT, db_path=DB_PATH):
+    # Corrected versions of query, best first; [] when nothing close is known
+    return cached_query(("suggest", normalise(query), limit), lambda: _suggest(query, limit, db_path), db_path)
+
+
+def _suggest(query, limit, db_path):
+    words = re.findall(r"\w+", normalise(query))
+    index = spelling_index(db_path)
+    options = []
+    for word in words:
+        if len(word) < MIN_WORD_LENGTH or not word.isalpha():
+            options.append([word])
+        else:
+            options.append(index.lookup(word, limit) or [word])
+    if all(len(o) == 1 and o[0] == w for o, w in zip(options, words)):
+        return []
+    # The best correction for every word, then the runner-up corrections one word at a time
+    best = [o[0] for o in options]
+    suggestions = [" ".join(best)]
+    for position, alternatives in enumerate(options):
+        for alternative in alternatives[1:]:
+            suggestions.append(" ".join(best[:position] + [alternative] + best[position + 1:]))
+    return [s for s in dict.fromkeys(suggestions) if s != " ".join(words)][:limit]
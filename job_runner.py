@@ -0,0 +1,229 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+# ========================
+# Background jobs shared by every page and session.
+# Heavy work runs on a small thread pool instead of the Streamlit script
+# thread. Each job has an id, progress, an optional partial result and a
+# cancel flag. Jobs submitted with the same key are shared, so two sessions
+# asking for the same simulation run it once. A finished job's result is held
+# only until every session waiting on it has collected it (results can be
+# large); the job itself stays listed with its status for an hour.
+# ========================
+JOB_WORKERS = 4
+KEEP_FINISHED_SECONDS = 3600
+KEEP_RESULT_SECONDS = 120  # backstop for results a waiting session never collected
+POLL_SECONDS = 0.5
+# For process pools started inside a job: forking this threaded server process can
+# deadlock a child on a lock held at fork time, so workers start from a clean process
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, name, key=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.key = key
+        self.status = "pending"  # pending, running, done, failed, cancelled
+        self.progress = 0.0
+        self.message = ""
+        self.partial = None      # latest intermediate result, e.g. a streaming summary
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.watchers = 0        # sessions waiting to collect the result
+        self.released = False    # result dropped after collection
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def release(self):
+        self.result = None
+        self.partial = None
+        self.released = True
+
+    def report(self, progress=None, message=None, partial=None):
+        # Called by the job function between steps; raises JobCancelled once cancel() was requested
+        if self._cancel.is_set():
+            raise JobCancelled()
+        if progress is not None:
+            self.progress = min(max(float(progress), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+        if partial is not None:
+            self.partial = partial
+
+
+class JobRunner:
+    def __init__(self, max_workers=JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name, fn, *args, key=None, **kwargs):
+        # Runs fn(job, *args, **kwargs) in the background. A pending, running or finished job
+        # with the same key is returned instead of starting a new one; failed, cancelled and
+        # released jobs are replaced.
+        with self._lock:
+            self._prune()
+            existing = self._jobs.get(self._by_key.get(key)) if key is not None else None
+            if existing is not None and existing.status not in ("failed", "cancelled") and not existing.released:
+                return existing
+            job = Job(name, key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._by_key[key] = job.id
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def find(self, key):
+        with self._lock:
+            return self._jobs.get(self._by_key.get(key))
+
+    def watch(self, job):
+        # A session starts waiting for job's result
+        with self._lock:
+            job.watchers += 1
+
+    def unwatch(self, job):
+        # A session stops waiting (it collected the result or moved on). A finished
+        # result that no other session is waiting for is released.
+        with self._lock:
+            job.watchers = max(job.watchers - 1, 0)
+            if job.watchers == 0 and job.done:
+                job.release()
+
+    def collect(self, job, watching):
+        # A finished job's result for one session, or None if it was already released
+        with self._lock:
+            result = job.result
+        if watching:
+            self.unwatch(job)
+        return result
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancel_requested:
+            job.status = "cancelled"
+        else:
+            job.status = "running"
+            try:
+                job.result = fn(job, *args, **kwargs)
+                job.progress = 1.0
+                job.status = "cancelled" if job.cancel_requested else "done"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "failed"
+        job.finished = time.time()
+
+    def _prune(self):
+        # Release uncollected results after KEEP_RESULT_SECONDS and forget finished jobs
+        # after KEEP_FINISHED_SECONDS (caller holds the lock)
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if not job.done:
+                continue
+            if not job.released and job.finished < now - KEEP_RESULT_SECONDS:
+                job.release()
+            if job.finished < now - KEEP_FINISHED_SECONDS:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) == job_id:
+                    del self._by_key[job.key]
+
+
+# Shared by every session in the process
+JOBS = JobRunner()
+
+
+# ========================
+# Streamlit handoff
+# ========================
+def background(slot, name, fn, *args, key=None, show_partial=None, **kwargs):
+    # Returns fn's result for `key`, computed off the script thread. The result is kept in
+    # st.session_state[slot]; until it is ready this shows progress with a cancel button
+    # (redrawn by a fragment, so the page itself is not rerun) and stops the script.
+    held = st.session_state.get(slot)
+    if held is not None and held[0] == key:
+        return held[1]
+
+    previous = JOBS.get(st.session_state.get(f"{slot}_job"))
+    if previous is not None and previous.key == key and previous.status == "cancelled":
+        st.info(f"⏹️ {name} cancelled.")
+        if st.button("Run again", key=f"{slot}_restart"):
+            st.session_state.pop(f"{slot}_job")
+            st.rerun()
+        st.stop()
+    if previous is not None and previous.key == key and previous.status == "failed":
+        # submit() would replace it; only start again when asked, or a job that always
+        # fails is rerun on every poll
+        st.error(f"❌ {name} failed: {previous.error}")
+        if st.button("Retry", key=f"{slot}_retry"):
+            st.session_state.pop(f"{slot}_job")
+            st.rerun()
+        st.stop()
+
+    job = JOBS.submit(name, fn, *args, key=key, **kwargs)
+    watching = previous is job  # this session is already waiting on it
+    if previous is not None and not watching:
+        JOBS.unwatch(previous)  # moved on, e.g. an input changed while it was running
+        st.session_state.pop(f"{slot}_job")
+    if job.status == "done":
+        # The runner keeps the result only until every waiting session has it
+        result = JOBS.collect(job, watching)
+        if result is None:
+            st.rerun()  # released between submit and collect: resubmit
+        st.session_state[slot] = (key, result)
+        st.session_state.pop(f"{slot}_job", None)
+        return result
+    st.session_state[f"{slot}_job"] = job.id
+    if job.status == "failed":
+        st.error(f"❌ {name} failed: {job.error}")
+        st.stop()
+    if not watching:
+        JOBS.watch(job)
+
+    @st.fragment(run_every=POLL_SECONDS)
+    def poll():
+        if job.done:
+            st.rerun()
+        st.progress(job.progress, text=job.message or f"{name}...")
+        if job.partial is not None and show_partial is not None:
+            show_partial(job.partial)
+        if st.button("Cancel", key=f"{slot}_cancel_{job.id}"):
+            job.cancel()
+            st.rerun()
+
+    poll()
+    st.stop()
@@ -0,0 +1,482 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from job_runner import POOL_CONTEXT
+from online_stats import Histogram, QuantileSketch, RunningMoments
+from result_cache import ResultCache, make_key
+from samplers import sample_unit, scale_to_ranges
+from sensitivity import sobol_indices
+
+# ========================
+# Discounting helpers
+# ========================
+def annuity_factor(rate, years):
+    # Present value of 1 paid at the end of each year for `years` years
+    rate = np.asarray(rate, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = (1 - (1 + rate) ** -years) / rate
+    return np.where(np.abs(rate) < 1e-12, float(years), factor)
+
+
+def _annuity_factor_and_slope(rate, years):
+    # annuity_factor and its derivative in r from a single power evaluation,
+    # with the r -> 0 limits filled in
+    rate = np.asarray(rate, dtype=float)
+    near_zero = np.abs(rate) < 1e-12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        discount = (1 + rate) ** -years
+        factor = (1 - discount) / rate
+        slope = (years * discount / (1 + rate) - factor) / rate
+    factor = np.where(near_zero, float(years), factor)
+    slope = np.where(near_zero, -years * (years + 1) / 2.0, slope)
+    return factor, slope
+
+
+# ========================
+# Vectorized root finding
+# ========================
+def _bracketed_newton(fn, lo, hi, x0=None, tol=1e-10, max_iter=100):
+    # Solve fn(r, rows) = 0 for a whole batch at once. fn returns (value, slope)
+    # arrays for the selected rows. Newton steps are used while they stay inside
+    # the [lo, hi] bracket, otherwise we fall back to bisection, so every row
+    # converges. Converged rows drop out of the working set.
+    lo = np.array(lo, dtype=float)
+    hi = np.array(hi, dtype=float)
+    all_rows = np.arange(lo.size)
+    f_lo, _ = fn(lo, all_rows)
+    f_hi, _ = fn(hi, all_rows)
+
+    # Rows without a sign change have no root in the bracket
+    valid = np.sign(f_lo) * np.sign(f_hi) <= 0
+    x = 0.5 * (lo + hi) if x0 is None else np.clip(np.array(x0, dtype=float), lo, hi)
+    rows = all_rows[valid]
+    lo, hi, f_lo, xa = lo[valid], hi[valid], f_lo[valid], x[valid]
+    for _ in range(max_iter):
+        if rows.size == 0:
+            break
+        f_x, df_x = fn(xa, rows)
+        same_as_lo = np.sign(f_x) == np.sign(f_lo)
+        lo = np.where(same_as_lo, xa, lo)
+        f_lo = np.where(same_as_lo, f_x, f_lo)
+        hi = np.where(same_as_lo, hi, xa)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_new = xa - f_x / df_x
+        bisect = ~np.isfinite(x_new) | (x_new <= np.minimum(lo, hi)) | (x_new >= np.maximum(lo, hi))
+        x_new = np.where(bisect, 0.5 * (lo + hi), x_new)
+
+        done = (np.abs(x_new - xa) <= tol * (1 + np.abs(xa))) | (f_x == 0)
+        x[rows] = np.where(f_x == 0, xa, x_new)
+        keep = ~done
+        rows, lo, hi, f_lo, xa = rows[keep], lo[keep], hi[keep], f_lo[keep], x_new[keep]
+    return np.where(valid, x, np.nan)
+
+
+def _solve_irr(fn, x0, max_rate):
+    # Bracket x = log(1 + r) between r = -1 + 1e-9 and an upper bound that is
+    # widened until NPV turns negative (very profitable trials), then solve
+    lo = np.full(x0.shape, np.log(1e-9))
+    hi = np.ones(x0.shape)
+    all_rows = np.arange(x0.size)
+    with np.errstate(over="ignore", invalid="ignore"):
+        f_hi, _ = fn(hi, all_rows)
+        while np.any((f_hi > 0) & (hi < np.log1p(max_rate))):
+            hi = np.where(f_hi > 0, hi * 2, hi)
+            f_hi, _ = fn(hi, all_rows)
+        return np.expm1(_bracketed_newton(fn, lo, hi, x0=x0))
+
+
+def annuity_irr(cashflow, investment, years, max_rate=1e6):
+    # IRR of -investment followed by `years` equal cashflows, for every trial at once
+    cashflow = np.asarray(cashflow, dtype=float)
+    irr = np.full(cashflow.shape, np.nan)
+    # No sign change in the cashflow stream means no IRR
+    positive = cashflow > 0
+    if investment <= 0 or not positive.any():
+        return irr
+    cf = cashflow[positive]
+
+    # Solve log(cf * a) = log(investment) in x = log(1 + r). In these
+    # coordinates the equation is close to linear, so Newton needs only a
+    # handful of steps even for deeply negative IRRs.
+    log_target = np.log(investment) - np.log(cf)
+
+    def fn(x, rows):
+        rate = np.expm1(x)
+        factor, slope = _annuity_factor_and_slope(rate, years)
+        return np.log(factor) - log_target[rows], slope * (1 + rate) / factor
+
+    # Start from the perpetuity yield, an upper bound on the annuity IRR
+    irr[positive] = _solve_irr(fn, np.log1p(cf / investment), max_rate)
+    return irr
+
+
+def batch_irr(cashflows, investment, max_rate=1e6):
+    # IRR of -investment followed by each row of a (trials x years) cashflow matrix.
+    # Rows need non-negative inflows with at least one positive (a conventional
+    # project, so the IRR is unique); other rows get NaN.
+    cashflows = np.asarray(cashflows, dtype=float)
+    irr = np.full(len(cashflows), np.nan)
+    conventional = np.all(cashflows >= 0, axis=1) & np.any(cashflows > 0, axis=1)
+    if investment <= 0 or not conventional.any():
+        return irr
+    # Year-major layout so each Horner step reads one contiguous row
+    cf_by_year = np.ascontiguousarray(cashflows[conventional].T)
+    log_investment = np.log(investment)
+
+    def fn(x, rows):
+        # Horner in v = 1 / (1 + r): PV = sum cf_t v^t and -dPV/dx = sum t cf_t v^t
+        v = np.exp(-x)
+        block = cf_by_year if len(rows) == cf_by_year.shape[1] else cf_by_year[:, rows]
+        pv = np.zeros(len(rows))
+        weighted = np.zeros(len(rows))
+        for t in range(len(block) - 1, -1, -1):
+            pv += block[t]
+            pv *= v
+            weighted += (t + 1) * block[t]
+            weighted *= v
+        return np.log(pv) - log_investment, -weighted / pv
+
+    x0 = np.log1p(cf_by_year.mean(axis=0) / investment)
+    irr[conventional] = _solve_irr(fn, x0, max_rate)
+    return irr
+
+
+# ========================
+# Cashflow paths
+# ========================
+PATH_CHUNK_SIZE = 100_000
+
+
+def discount_vector(rate, years):
+    return (1 + rate) ** -np.arange(1, years + 1)
+
+
+def cashflow_factors(rng, n, years, growth=0.0, volatility=0.0, correlation=0.0):
+    # (n, years) multipliers on the year-1 cashflow: trend growth times mean-one
+    # lognormal shocks whose year-to-year correlation decays as correlation ** lag
+    t = np.arange(years)
+    corr = float(correlation) ** np.abs(t[:, None] - t[None, :])
+    chol = np.linalg.cholesky(corr + 1e-12 * np.eye(years))
+    shocks = rng.standard_normal((n, years)) @ chol.T
+    return (1 + growth) ** t * np.exp(volatility * shocks - volatility ** 2 / 2)
+
+
+# ========================
+# Convergence diagnostics
+# ========================
+DEFAULT_REPLICATES = 10
+
+
+def replicate_std_error(values, replicates):
+    # Standard error of the mean from the spread of independent replicate means.
+    # Unlike s/sqrt(n) this stays valid for Latin hypercube and Sobol samples.
+    means = np.array([np.mean(block) for block in np.array_split(np.asarray(values, dtype=float), replicates)])
+    if len(means) < 2:
+        return np.nan
+    return np.std(means, ddof=1) / np.sqrt(len(means))
+
+
+def running_mean(values, points=500):
+    # Cumulative mean after each trial, thinned to about `points` samples for plotting
+    values = np.asarray(values, dtype=float)
+    trials = np.unique(np.linspace(1, len(values), min(points, len(values))).astype(np.int64))
+    return trials, np.cumsum(values)[trials - 1] / trials
+
+
+# ========================
+# Monte Carlo engine
+# ========================
+def evaluate_trials(sales, prices, costs, years, initial_investment, discount_rate, factors=None):
+    # NPV, ROI, IRR and break-even sales for arrays of sampled inputs.
+    # factors: optional (trials x years) cashflow multipliers from cashflow_factors;
+    # without them every year repeats the year-1 cashflow.
+    margin = prices - costs
+    annual_cashflows = sales * margin  # profit before investment
+
+    if factors is None:
+        pv_factor = float(annuity_factor(discount_rate, years))
+        total_factor = years
+        irrs = annuity_irr(annual_cashflows, initial_investment, years)
+    else:
+        # One (trials x years) matrix; discounting is a matrix-vector product
+        cashflows = annual_cashflows[:, None] * factors
+        pv_factor = factors @ discount_vector(discount_rate, years)
+        total_factor = factors.sum(axis=1)
+        irrs = batch_irr(cashflows, initial_investment)
+
+    npvs = annual_cashflows * pv_factor - initial_investment
+    if initial_investment > 0:
+        rois = (annual_cashflows * total_factor - initial_investment) / initial_investment
+    else:
+        rois = np.full(annual_cashflows.shape, np.nan)
+
+    # Break-even year-1 sales volume (NPV=0), only where each unit makes money
+    with np.errstate(divide="ignore", invalid="ignore"):
+        breakeven_sales = np.where(margin > 0, initial_investment / (margin * pv_factor), np.nan)
+
+    return {
+        "npvs": npvs,
+        "rois": rois,
+        "irrs": irrs,
+        "breakeven_sales": breakeven_sales,
+    }
+
+
+def _simulate_trials(rng, years, sales_range, price_range, cost_range, initial_investment,
+                     discount_rate, simulations, sampler="random", cashflow_model=None):
+    # cashflow_model: None for flat cashflows, or dict(growth=, volatility=, correlation=)
+    unit = sample_unit(sampler, rng, simulations, 3)
+    inputs = scale_to_ranges(unit, [sales_range, price_range, cost_range])
+    sales, prices, costs = inputs[:, 0], inputs[:, 1], inputs[:, 2]
+
+    if cashflow_model is None:
+        results = evaluate_trials(sales, prices, costs, years, initial_investment, discount_rate)
+    else:
+        # Paths are drawn and reduced in row chunks, so memory is chunk x years
+        parts = []
+        for start in range(0, simulations, PATH_CHUNK_SIZE):
+            rows = slice(start, start + PATH_CHUNK_SIZE)
+            factors = cashflow_factors(rng, len(sales[rows]), years, **cashflow_model)
+            parts.append(evaluate_trials(sales[rows], prices[rows], costs[rows], years,
+                                         initial_investment, discount_rate, factors=factors))
+        results = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+    results.update({"sales": sales, "prices": prices, "costs": costs})
+    return results
+
+
+def run_simulation(years, sales_range, price_range, cost_range, initial_investment,
+                   discount_rate, simulations, seed=42, sampler="random", replicates=DEFAULT_REPLICATES,
+                   cashflow_model=None):
+    # Trials are drawn as `replicates` independent blocks (each its own RNG stream,
+    # and for Sobol its own scramble), which is what replicate_std_error relies on
+    params = (years, sales_range, price_range, cost_range, initial_investment, discount_rate)
+    sizes = [len(block) for block in np.array_split(np.arange(simulations), replicates)]
+    blocks = [
+        _simulate_trials(np.random.default_rng(child), *params, size, sampler=sampler,
+                         cashflow_model=cashflow_model)
+        for size, child in zip(sizes, np.random.SeedSequence(seed).spawn(replicates))
+    ]
+    results = {key: np.concatenate([block[key] for block in blocks]) for key in blocks[0]}
+    results["replicates"] = replicates
+    return results
+
+
+# Shared by every session; repeat views with the same inputs skip the simulation
+SIMULATION_CACHE = ResultCache(max_mb=256, disk_dir=os.path.join(".cache", "monte_carlo"))
+
+
+def simulation_key(years, sales_range, price_range, cost_range, initial_investment,
+                   discount_rate, simulations, seed=42, sampler="random", replicates=DEFAULT_REPLICATES,
+                   cashflow_model=None):
+    return make_key(
+        years=years, sales_range=sales_range, price_range=price_range, cost_range=cost_range,
+        initial_investment=initial_investment, discount_rate=discount_rate,
+        simulations=int(simulations), seed=seed, sampler=sampler, replicates=replicates,
+        cashflow_model=cashflow_model,
+    )
+
+
+def cached_simulation(*args, cache=SIMULATION_CACHE, **kwargs):
+    # run_simulation through the result cache; returns (key, results)
+    key = simulation_key(*args, **kwargs)
+    return key, cache.get_or_compute(key, lambda: run_simulation(*args, **kwargs))
+
+
+# ========================
+# Global sensitivity
+# ========================
+SENSITIVITY_INPUTS = ["Sales", "Price", "Cost"]
+PATH_INPUT = "Cashflow path"  # extra input when a cashflow model is used
+PATH_DRAWS = 2 ** 16
+
+
+def sensitivity_inputs(cashflow_model=None):
+    return SENSITIVITY_INPUTS + ([PATH_INPUT] if cashflow_model is not None else [])
+
+
+def npv_sobol_indices(years, sales_range, price_range, cost_range, initial_investment,
+                      discount_rate, base_samples, seed=42, sampler="random", bootstrap=200,
+                      cashflow_model=None):
+    # Sobol indices of NPV with respect to sales, price and cost; these capture the
+    # sales * (price - cost) interaction that plain correlations miss.
+    # With a cashflow model, NPV depends on the random path only through its discounted
+    # factor sum, so the path shocks enter as a fourth input: a uniform mapped through
+    # the empirical distribution of PATH_DRAWS simulated paths. Its indices are the
+    # share of NPV variance that comes from path noise.
+    ranges = [sales_range, price_range, cost_range]
+    rng = np.random.default_rng(seed)
+    if cashflow_model is None:
+        pv_draws = None
+        pv_factor = float(annuity_factor(discount_rate, years))
+    else:
+        pv_draws = np.sort(cashflow_factors(rng, PATH_DRAWS, years, **cashflow_model)
+                           @ discount_vector(discount_rate, years))
+
+    def npv_model(unit):
+        inputs = scale_to_ranges(unit[:, :3], ranges)
+        if pv_draws is None:
+            pv = pv_factor
+        else:
+            pv = pv_draws[np.minimum((unit[:, 3] * PATH_DRAWS).astype(np.int64), PATH_DRAWS - 1)]
+        return inputs[:, 0] * (inputs[:, 1] - inputs[:, 2]) * pv - initial_investment
+
+    dims = len(sensitivity_inputs(cashflow_model))
+    return sobol_indices(npv_model, dims, int(base_samples), rng, sampler=sampler, bootstrap=bootstrap)
+
+
+def sobol_key(*args, **kwargs):
+    return make_key(kind="sobol_indices", args=args, kwargs=kwargs)
+
+
+def cached_npv_sobol_indices(*args, cache=SIMULATION_CACHE, **kwargs):
+    return cache.get_or_compute(sobol_key(*args, **kwargs), lambda: npv_sobol_indices(*args, **kwargs))
+
+
+# ========================
+# Streaming mode
+# ========================
+DEFAULT_CHUNK_SIZE = 250_000
+PILOT_SIZE = 10_000
+
+
+class SimulationSummary:
+    # Constant-memory summary of any number of trials. Histogram edges are fixed
+    # up front so summaries of separate chunks can be merged exactly.
+    def __init__(self, npv_edges, irr_edges, compression=200):
+        self.inputs = RunningMoments(4)  # sales, prices, costs, npv
+        self.rois = RunningMoments(1)
+        self.irrs = RunningMoments(1)
+        self.breakeven_sales = RunningMoments(1)
+        self.npv_positive = 0
+        # Per-chunk (mean NPV, share NPV > 0); chunks are independent replicates
+        self.chunk_means = RunningMoments(2)
+        self.npv_hist = Histogram(npv_edges)
+        self.irr_hist = Histogram(irr_edges)
+        self.npv_sketch = QuantileSketch(compression)
+        self.roi_sketch = QuantileSketch(compression)
+        self.irr_sketch = QuantileSketch(compression)
+
+    def empty_copy(self):
+        return SimulationSummary(self.npv_hist.edges, self.irr_hist.edges, self.npv_sketch.compression)
+
+    @property
+    def count(self):
+        return self.inputs.count
+
+    def update(self, results):
+        npvs = results["npvs"]
+        irrs = results["irrs"][np.isfinite(results["irrs"])]
+        rois = results["rois"][np.isfinite(results["rois"])]
+        breakeven = results["breakeven_sales"][np.isfinite(results["breakeven_sales"])]
+
+        self.inputs.update(np.column_stack([results["sales"], results["prices"], results["costs"], npvs]))
+        self.rois.update(rois)
+        self.irrs.update(irrs)
+        self.breakeven_sales.update(breakeven)
+        self.npv_positive += int(np.count_nonzero(npvs > 0))
+        self.chunk_means.update([[np.mean(npvs), np.mean(npvs > 0)]])
+        self.npv_hist.update(npvs)
+        self.irr_hist.update(irrs)
+        self.npv_sketch.update(npvs)
+        self.roi_sketch.update(rois)
+        self.irr_sketch.update(irrs)
+
+    def merge(self, other):
+        self.inputs.merge(other.inputs)
+        self.rois.merge(other.rois)
+        self.irrs.merge(other.irrs)
+        self.breakeven_sales.merge(other.breakeven_sales)
+        self.npv_positive += other.npv_positive
+        self.chunk_means.merge(other.chunk_means)
+        self.npv_hist.merge(other.npv_hist)
+        self.irr_hist.merge(other.irr_hist)
+        self.npv_sketch.merge(other.npv_sketch)
+        self.roi_sketch.merge(other.roi_sketch)
+        self.irr_sketch.merge(other.irr_sketch)
+
+    def mean_npv(self):
+        return self.inputs.mean[3]
+
+    def std_npv(self):
+        return np.sqrt(self.inputs.variance()[3])
+
+    def prob_npv_positive(self):
+        return self.npv_positive / self.count if self.count else np.nan
+
+    def std_errors(self):
+        # Standard errors of (mean NPV, P(NPV > 0)) from the spread of chunk results
+        return self.chunk_means.std_error()
+
+    def npv_correlations(self):
+        corr = self.inputs.correlation()
+        return dict(zip(["Sales", "Price", "Cost"], corr[3, :3]))
+
+
+def histogram_edges(results, bins=40):
+    # Bin edges from a pilot sample. Streaming histograms need fixed edges so
+    # chunks can be merged; later values outside them land in the end bins.
+    edges = []
+    for values in (results["npvs"], results["irrs"]):
+        values = values[np.isfinite(values)]
+        lo, hi = np.quantile(values, [0.001, 0.999]) if len(values) else (-1.0, 1.0)
+        if hi <= lo:
+            lo, hi = lo - 0.5, hi + 0.5
+        edges.append(np.linspace(lo, hi, bins + 1))
+    return edges
+
+
+def chunk_sizes(simulations, chunk_size=DEFAULT_CHUNK_SIZE):
+    full, rest = divmod(int(simulations), chunk_size)
+    return [chunk_size] * full + ([rest] if rest else [])
+
+
+def simulate_chunk(summary_template, seed_seq, sampler, cashflow_model, years, sales_range, price_range,
+                   cost_range, initial_investment, discount_rate, simulations):
+    # Summary of one chunk, drawn from its own RNG stream
+    rng = np.random.default_rng(seed_seq)
+    results = _simulate_trials(rng, years, sales_range, price_range, cost_range, initial_investment,
+                               discount_rate, simulations, sampler=sampler, cashflow_model=cashflow_model)
+    summary = summary_template.empty_copy()
+    summary.update(results)
+    return summary
+
+
+def _chunk_summaries(template, seeds, sampler, cashflow_model, sizes, params, workers):
+    # Chunk summaries in chunk order. With workers > 1 the chunks run in a
+    # process pool; map() keeps the order, so the reduce below is identical
+    # to the serial one whatever the worker count.
+    if workers <= 1:
+        for size, child in zip(sizes, seeds):
+            yield simulate_chunk(template, child, sampler, cashflow_model, *params, size)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT)
+    try:
+        yield from pool.map(simulate_chunk, repeat(template), seeds, repeat(sampler), repeat(cashflow_model),
+                            *[repeat(p) for p in params], sizes)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def stream_simulation(years, sales_range, price_range, cost_range, initial_investment,
+                      discount_rate, simulations, seed=42, chunk_size=DEFAULT_CHUNK_SIZE, bins=40,
+                      workers=1, sampler="random", cashflow_model=None):
+    # Yields the running summary after every chunk so callers can show partial results.
+    # Each chunk has its own child seed, so results only depend on seed and chunk_size,
+    # never on the number of worker processes.
+    params = (years, sales_range, price_range, cost_range, initial_investment, discount_rate)
+    sizes = chunk_sizes(simulations, chunk_size)
+    pilot_seed, *chunk_seeds = np.random.SeedSequence(seed).spawn(len(sizes) + 1)
+    pilot = _simulate_trials(np.random.default_rng(pilot_seed), *params, PILOT_SIZE, sampler=sampler,
+                             cashflow_model=cashflow_model)
+    template = SimulationSummary(*histogram_edges(pilot, bins=bins))
+
+    summary = template.empty_copy()
+    for part in _chunk_summaries(template, chunk_seeds, sampler, cashflow_model, sizes, params, workers):
+        summary.merge(part)
+        yield summary
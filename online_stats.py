@@ -0,0 +1,121 @@
+import numpy as np
+
+# ========================
+# Online statistics that update chunk by chunk and merge in any grouping,
+# so very large runs never need every sample in memory at once.
+# ========================
+
+
+class RunningMoments:
+    # Count, mean and co-moment matrix of a fixed set of columns.
+    # Chunks are combined with Chan et al.'s pairwise update.
+    def __init__(self, n_columns):
+        self.count = 0
+        self.mean = np.zeros(n_columns)
+        self.comoment = np.zeros((n_columns, n_columns))
+
+    def update(self, data):
+        data = np.asarray(data, dtype=float)
+        if data.ndim == 1:
+            data = data[:, None]
+        if len(data) == 0:
+            return
+        chunk = RunningMoments(data.shape[1])
+        chunk.count = len(data)
+        chunk.mean = data.mean(axis=0)
+        centred = data - chunk.mean
+        chunk.comoment = centred.T @ centred
+        self.merge(chunk)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * self.count * other.count / total
+        self.mean = self.mean + delta * other.count / total
+        self.count = total
+
+    def variance(self):
+        if self.count < 2:
+            return np.full(len(self.mean), np.nan)
+        return np.diag(self.comoment) / (self.count - 1)
+
+    def std_error(self):
+        return np.sqrt(self.variance() / self.count)
+
+    def correlation(self):
+        scale = np.sqrt(np.diag(self.comoment))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.comoment / np.outer(scale, scale)
+
+
+class Histogram:
+    # Fixed-edge histogram; values outside the edges land in the end bins
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+
+    def update(self, values):
+        values = np.clip(values, self.edges[0], self.edges[-1])
+        self.counts += np.histogram(values, bins=self.edges)[0]
+
+    def merge(self, other):
+        self.counts += other.counts
+
+
+class QuantileSketch:
+    # Merging t-digest: weighted centroids whose size is bounded by the k1
+    # scale function, so the tails stay sharp while the middle is summarised.
+    # Memory is O(compression) regardless of how many values were added.
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+
+    def merge(self, other):
+        if len(other.means) == 0:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]),
+                       np.concatenate([self.weights, other.weights]))
+
+    def _compress(self, means, weights):
+        order = np.argsort(means)
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        # k1 scale of the left edge of each centroid decides which group it joins
+        q = (cumulative - weights) / cumulative[-1]
+        k = self.compression * (np.arcsin(2 * q - 1) / np.pi + 0.5)
+        k = np.floor(k)
+        # k is non-decreasing, so renumbering the groups is a running count of changes
+        groups = np.concatenate([[0], np.cumsum(k[1:] != k[:-1])])
+        self.weights = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=weights * means) / self.weights
+
+    def quantile(self, q):
+        q = np.asarray(q, dtype=float)
+        if len(self.means) == 0:
+            return np.full(q.shape, np.nan)
+        # Interpolate between centroid centres, pinned to the exact min and max
+        centres = (np.cumsum(self.weights) - self.weights / 2) / self.count
+        positions = np.concatenate([[0.0], centres, [1.0]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(q, positions, values)
@@ -1,6 +1,18 @@
+import time
 import streamlit as st
 import pandas as pd
-from registry_db import init_db, insert_project, fetch_projects, update_project, delete_project
+from datetime import datetime
+from credit_jobs import factor_history, recompute_credits
+from registry_db import (INDUSTRIES, PROJECT_COLUMNS, count_projects, delete_project, get_project,
+                         industry_summary, insert_project, page_projects, registry_totals, update_project)
+from methodologies import BASELINE_FACTORS, METHODOLOGIES, ev_charging, fleet_efficiency, score, solid_waste
+from registry_audit import project_history, registry_as_of, snapshot_due, take_snapshot
+from registry_io import FORMATS, detect_format, estimated_credits, export_bytes, import_projects
+from job_runner import JOBS, background
+
+PAGE_SIZE = 25
+SORT_LABELS = {"ID": "id", "Name": "name", "Industry": "industry", "Output": "output_tonnes", "Estimated Credits": "estimated_credits"}
+LISTING_COLUMNS = ["ID","Name","Description","Industry","Baseline","Output","Actual","Leakage","Estimated Credits"]
 
 # =========================
 # Utility: Clear Form State
@@ -10,18 +22,29 @@ def clear_form(keys):
         if k in st.session_state:
             del st.session_state[k]
 
+# =========================
+# Background jobs
+# =========================
+def snapshot_job(job):
+    job.report(0.0, "Taking registry snapshot...")
+    return take_snapshot()
+
+def revision_job(job, industry, baseline_intensity):
+    # Cancelling between batches rolls the whole revision back
+    return recompute_credits(industry, baseline_intensity, progress=lambda done, total: job.report(
+        done / max(total, 1), f"{done:,} of {total:,} {industry} projects updated..."))
+
 # =========================
 # REGISTRY
 # =========================
 def run_registry():
     st.subheader("Project Registry")
     st.markdown("Register carbon projects and estimate potential credits.")
-    init_db()
 
     with st.form("project_form"):
         name = st.text_input("Project Name", key="reg_name")
         description = st.text_area("Description", key="reg_desc")
-        industry = st.selectbox("Industry", ["Cement","Steel","Aluminium","Electricity","Fertilizer","Glass","Pulp & Paper"], key="reg_ind")
+        industry = st.selectbox("Industry", INDUSTRIES, key="reg_ind")
         baseline_intensity = st.number_input("Baseline Emission Intensity (tCO₂e/tonne)", key="reg_base", min_value=0.0, step=0.01)
         output_tonnes = st.number_input("Output Produced (tonnes)", key="reg_out", min_value=0.0, step=0.1)
         actual_emissions = st.number_input("Actual Emissions (tCO₂e)", key="reg_act", min_value=0.0, step=0.1)
@@ -29,44 +52,161 @@ def run_registry():
         submitted = st.form_submit_button("Save Project")
 
     if submitted:
-        estimated_credits = (baseline_intensity * output_tonnes) - actual_emissions - leakage
-        data = (name, description, industry, baseline_intensity, output_tonnes, actual_emissions, leakage, estimated_credits)
+        credits = estimated_credits(baseline_intensity, output_tonnes, actual_emissions, leakage)
+        data = (name, description, industry, baseline_intensity, output_tonnes, actual_emissions, leakage, credits)
         insert_project(data)
-        st.success(f"✅ {name} saved with {estimated_credits:.2f} tCO₂e credits estimated.")
+        st.success(f"✅ {name} saved with {credits:.2f} tCO₂e credits estimated.")
         st.rerun()
 
+    with st.expander("📦 Bulk import / export"):
+        st.caption("Columns: name, description, industry, baseline_intensity, output_tonnes, actual_emissions, leakage. "
+                   "Estimated credits are recalculated on import.")
+        upload = st.file_uploader("Import projects", type=["csv", "parquet", "jsonl", "ndjson"], key="reg_import")
+        if upload is not None and st.button("Import", key="reg_import_go"):
+            try:
+                with st.spinner("Importing..."):
+                    counts = import_projects(upload, detect_format(upload.name))
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                st.success(f"✅ Imported {counts['inserted']:,} projects ({counts['rejected']:,} rows rejected).")
+        fmt = st.selectbox("Export format", FORMATS, key="reg_export_fmt")
+        if st.button("Prepare export", key="reg_export_go"):
+            st.download_button("⬇️ Download", export_bytes(fmt), file_name=f"projects.{fmt}", key="reg_export_dl")
+
+    with st.expander("🔁 Revise baseline factor"):
+        st.caption("Sets a new baseline emission intensity for every project in an industry and recalculates their credits.")
+        rev_ind = st.selectbox("Industry", INDUSTRIES, key="rev_ind")
+        rev_base = st.number_input("New Baseline Intensity (tCO₂e/tonne)", key="rev_base", min_value=0.0, step=0.01)
+        if st.button("Apply revision", key="rev_go"):
+            # The click time is part of the job key, so applying the same values again is a new revision
+            st.session_state["rev_request"] = (rev_ind, rev_base, time.time())
+        if "rev_request" in st.session_state:
+            request = st.session_state["rev_request"]
+            result = background("rev_result", "Recalculating credits", revision_job, *request[:2],
+                                key=("revision",) + request)
+            st.success(f"✅ Version {result['version']}: {result['projects_updated']:,} {result['industry']} projects "
+                       f"updated in {result['seconds']:.2f}s ({result['credits_before']:,.0f} → "
+                       f"{result['credits_after']:,.0f} tCO₂e).")
+        history = factor_history()
+        if history:
+            st.dataframe(pd.DataFrame(history)[["version", "created_at", "industry", "baseline_intensity",
+                                                "projects_updated", "credits_before", "credits_after"]],
+                         hide_index=True, width="stretch")
+
+    with st.expander("🕰️ Registry history"):
+        h1, h2 = st.columns(2)
+        as_of_date = h1.date_input("As of date", key="hist_date")
+        as_of_time = h2.time_input("Time", key="hist_time")
+        if st.button("Show registry at this time", key="hist_go"):
+            past = registry_as_of(datetime.combine(as_of_date, as_of_time).timestamp())
+            st.caption(f"{len(past):,} projects · {past['estimated_credits'].sum():,.0f} tCO₂e estimated"
+                       + (" · first 1,000 shown" if len(past) > 1000 else ""))
+            st.dataframe(past.head(1000), width="stretch")
+
+    # Snapshots keep as-of queries short: one is taken whenever enough changes have accumulated.
+    # Taking one reads the whole registry, so it runs on the job runner under a fixed key:
+    # once, in the background, whichever session notices first.
+    if snapshot_due():
+        JOBS.submit("Registry snapshot", snapshot_job, key="registry_snapshot")
+
     st.markdown("---")
     st.subheader("Registered Projects")
-    rows = fetch_projects()
-    if not rows:
+    totals = registry_totals()
+    if not totals["projects"]:
         st.info("No projects registered yet.")
         return
 
-    df = pd.DataFrame(rows, columns=["ID","Name","Description","Industry","Baseline","Output","Actual","Leakage","Estimated Credits"])
-
-    for _, row in df.iterrows():
-        with st.expander(f"🔹 {row['Name']}"):
-            col1, col2 = st.columns([4,1])
-            with col1:
-                edit_name = st.text_input("Name", value=row["Name"], key=f"edit_name_{row['ID']}")
-                edit_desc = st.text_area("Description", value=row["Description"], key=f"edit_desc_{row['ID']}")
-                edit_ind = st.selectbox("Industry", ["Cement","Steel","Aluminium","Electricity","Fertilizer","Glass","Pulp & Paper"], 
-                                        index=["Cement","Steel","Aluminium","Electricity","Fertilizer","Glass","Pulp & Paper"].index(row["Industry"]),
-                                        key=f"edit_ind_{row['ID']}")
-                edit_base = st.number_input("Baseline", value=row["Baseline"], key=f"edit_base_{row['ID']}")
-                edit_out = st.number_input("Output", value=row["Output"], key=f"edit_out_{row['ID']}")
-                edit_act = st.number_input("Actual", value=row["Actual"], key=f"edit_act_{row['ID']}")
-                edit_leak = st.number_input("Leakage", value=row["Leakage"], key=f"edit_leak_{row['ID']}")
-            with col2:
-                if st.button("💾 Save", key=f"save_{row['ID']}"):
-                    credits = (edit_base*edit_out)-edit_act-edit_leak
-                    update_project(row["ID"], edit_name, edit_desc, edit_ind, edit_base, edit_out, edit_act, edit_leak, credits)
-                    st.success("Updated!")
-                    st.rerun()
-                if st.button("🗑️ Delete", key=f"del_{row['ID']}"):
-                    delete_project(row["ID"])
-                    st.warning("Deleted.")
-                    st.rerun()
+    # Dashboard tiles come from the trigger-maintained industry summary (no table scan)
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Projects", f"{totals['projects']:,}")
+    m2.metric("Estimated Credits", f"{totals['total_credits']:,.0f} tCO₂e")
+    m3.metric("Average per Project", f"{totals['avg_credits']:,.1f} tCO₂e")
+    with st.expander("📊 By industry"):
+        summary = pd.DataFrame(industry_summary())
+        st.dataframe(
+            summary[["industry", "projects", "total_credits", "avg_credits", "avg_baseline_intensity"]]
+            .rename(columns={"industry": "Industry", "projects": "Projects", "total_credits": "Total Credits",
+                             "avg_credits": "Avg Credits", "avg_baseline_intensity": "Avg Baseline"}),
+            hide_index=True, width="stretch",
+        )
+
+    f1, f2, f3, f4 = st.columns([2, 2, 2, 1])
+    industry_filter = f1.selectbox("Industry", ["All", *INDUSTRIES], key="reg_filter_ind")
+    name_prefix = f2.text_input("Name starts with", key="reg_filter_name").strip()
+    sort_label = f3.selectbox("Sort by", list(SORT_LABELS), key="reg_sort")
+    descending = f4.checkbox("Descending", key="reg_sort_desc")
+    industry = None if industry_filter == "All" else industry_filter
+    sort = SORT_LABELS[sort_label]
+
+    # Keyset pagination: reg_cursors[i] is the (sort value, id) after which page i starts.
+    # Changing a filter or the sort starts again from page 1.
+    query = (industry, name_prefix, sort, descending)
+    if st.session_state.get("reg_query") != query:
+        st.session_state["reg_query"] = query
+        st.session_state["reg_cursors"] = [None]
+        st.session_state["reg_grid"] = st.session_state.get("reg_grid", 0) + 1
+    cursors = st.session_state["reg_cursors"]
+
+    rows = page_projects(sort, descending, industry, name_prefix, after=cursors[-1], limit=PAGE_SIZE + 1)
+    has_next = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    matches = count_projects(industry, name_prefix)
+    st.caption(f"{matches:,} projects · page {len(cursors)} of {max(1, -(-matches // PAGE_SIZE))}")
+
+    df = pd.DataFrame(rows, columns=LISTING_COLUMNS)
+    event = st.dataframe(
+        df.drop(columns=["Description"]), hide_index=True, width="stretch",
+        on_select="rerun", selection_mode="single-row", key=f"reg_grid_{st.session_state['reg_grid']}",
+    )
+
+    p1, p2 = st.columns(2)
+    if p1.button("◀ Previous", disabled=len(cursors) == 1, key="reg_prev"):
+        cursors.pop()
+        st.session_state["reg_grid"] += 1
+        st.rerun()
+    if p2.button("Next ▶", disabled=not has_next, key="reg_next"):
+        sort_at = ["id", *PROJECT_COLUMNS].index(sort)
+        cursors.append((rows[-1][sort_at], rows[-1][0]))
+        st.session_state["reg_grid"] += 1
+        st.rerun()
+
+    # Edit widgets exist only for the selected project
+    if not event.selection.rows:
+        st.caption("Select a project in the table to edit or delete it.")
+        return
+    row = get_project(int(df.iloc[event.selection.rows[0]]["ID"]))
+    if row is None:
+        return
+    project_id, name, description, industry, baseline, output, actual, leakage, _ = row
+    with st.form(f"edit_form_{project_id}"):
+        st.markdown(f"**🔹 {name}**")
+        edit_name = st.text_input("Name", value=name)
+        edit_desc = st.text_area("Description", value=description or "")
+        edit_ind = st.selectbox("Industry", INDUSTRIES,
+                                index=INDUSTRIES.index(industry) if industry in INDUSTRIES else 0)
+        edit_base = st.number_input("Baseline", value=float(baseline or 0.0))
+        edit_out = st.number_input("Output", value=float(output or 0.0))
+        edit_act = st.number_input("Actual", value=float(actual or 0.0))
+        edit_leak = st.number_input("Leakage", value=float(leakage or 0.0))
+        col1, col2 = st.columns(2)
+        save = col1.form_submit_button("💾 Save")
+        delete = col2.form_submit_button("🗑️ Delete")
+    if save:
+        credits = estimated_credits(edit_base, edit_out, edit_act, edit_leak)
+        update_project(project_id, edit_name, edit_desc, edit_ind, edit_base, edit_out, edit_act, edit_leak, credits)
+        st.success("Updated!")
+        st.rerun()
+    if delete:
+        delete_project(project_id)
+        st.session_state["reg_grid"] += 1
+        st.warning("Deleted.")
+        st.rerun()
+    with st.expander("Change history"):
+        for event in project_history(project_id):
+            when = datetime.fromtimestamp(event["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+            changes = ", ".join(f"{k} → {v}" for k, v in event["changes"].items())
+            st.markdown(f"- `{when}` **{event['op']}** {changes}")
 
 # =========================
 # EV CHARGING CALCULATOR
@@ -81,10 +221,9 @@ def run_ev_charging_calculator():
         years = st.number_input("Project Duration (years)", key="ev_years", min_value=1, step=1)
         submitted = st.form_submit_button("Calculate", key="ev_submit")
     if submitted:
-        BEy = fuel_avoided * ef_fuel
-        PEy = elec_used * ef_grid
-        annual_reduction = BEy - PEy
-        total_reduction = annual_reduction * years
+        result = ev_charging(fuel_avoided, ef_fuel, elec_used, ef_grid, years)
+        BEy, PEy = result["baseline_emissions"], result["project_emissions"]
+        annual_reduction, total_reduction = result["annual_reduction"], result["total_reduction"]
         st.metric("Baseline Emissions (BEy)", f"{BEy:.2f} kg CO₂e/year")
         st.metric("Project Emissions (PEy)", f"{PEy:.2f} kg CO₂e/year")
         st.metric("Annual Reduction", f"{annual_reduction:.2f} kg CO₂e/year")
@@ -105,9 +244,8 @@ def run_fleet_efficiency_calculator():
         distance = st.number_input("Distance Travelled (km/year)", key="fl_dist", min_value=0.0, step=10.0)
         submitted = st.form_submit_button("Calculate", key="fl_submit")
     if submitted:
-        old_em = (old_rate/100.0) * distance * ef_fuel
-        new_em = (new_rate/100.0) * distance * ef_fuel
-        reduction = old_em - new_em
+        result = fleet_efficiency(old_rate, new_rate, ef_fuel, distance)
+        old_em, new_em, reduction = result["old_emissions"], result["new_emissions"], result["reduction"]
         st.metric("Old Fleet Emissions", f"{old_em:.2f} kg CO₂e/year")
         st.metric("New Fleet Emissions", f"{new_em:.2f} kg CO₂e/year")
         st.metric("Emission Reduction", f"{reduction:.2f} kg CO₂e/year")
@@ -120,17 +258,14 @@ def run_fleet_efficiency_calculator():
 # =========================
 def run_solid_waste_calculator():
     st.subheader("Solid Waste Recycling Calculator (VMR0007)")
-    baseline_factors = {"Plastic":1.3,"Paper":1.0,"Metal":1.8,"Glass":0.5,"Other":0.8}
-    avoided_factors = {"Plastic":1.1,"Paper":0.6,"Metal":2.5,"Glass":0.3,"Other":0.5}
     with st.form("waste_form"):
-        material = st.selectbox("Material Type", list(baseline_factors.keys()), key="sw_material")
+        material = st.selectbox("Material Type", list(BASELINE_FACTORS), key="sw_material")
         tons = st.number_input("Tons Recovered per Year", key="sw_tons", min_value=0.0, step=0.1)
         pe = st.number_input("Project Emissions (tCO₂e/year)", key="sw_pe", min_value=0.0, step=0.1)
         submitted = st.form_submit_button("Calculate", key="sw_submit")
     if submitted:
-        BE = tons * baseline_factors[material]
-        AE = tons * avoided_factors[material]
-        ER = BE + AE - pe
+        result = solid_waste(material, tons, pe)
+        BE, AE, ER = result["baseline_emissions"], result["avoided_emissions"], result["emission_reductions"]
         st.metric("Baseline Emissions Avoided (BE)", f"{BE:.2f} tCO₂e/year")
         st.metric("Avoided Virgin Material Emissions (AE)", f"{AE:.2f} tCO₂e/year")
         st.metric("Project Emissions (PE)", f"{pe:.2f} tCO₂e/year")
@@ -139,6 +274,26 @@ def run_solid_waste_calculator():
         clear_form(["sw_material","sw_tons","sw_pe"])
         st.rerun()
 
+# =========================
+# PORTFOLIO SCORING
+# =========================
+def run_portfolio_scoring():
+    st.subheader("Score a Portfolio")
+    labels = {label: name for name, (_, _, label) in METHODOLOGIES.items()}
+    label = st.selectbox("Methodology", list(labels), key="pf_method")
+    methodology = labels[label]
+    st.caption("CSV with one row per fleet/site and columns: " + ", ".join(METHODOLOGIES[methodology][1]))
+    upload = st.file_uploader("Portfolio CSV", type=["csv"], key="pf_upload")
+    if upload is None:
+        return
+    try:
+        scored = score(methodology, pd.read_csv(upload))
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    st.dataframe(scored, hide_index=True, width="stretch")
+    st.download_button("⬇️ Download results", scored.to_csv(index=False), file_name=f"{methodology}_scored.csv", key="pf_download")
+
 # =========================
 # GENERAL CALCULATOR
 # =========================
@@ -182,13 +337,15 @@ def main():
     with tab2:
         run_general_calculator()
     with tab3:
-        tool = st.selectbox("Choose a methodology:", ["EV Charging (VM0038)", "Fleet Efficiency (VMR0004)", "Solid Waste Recycling (VMR0007)"])
+        tool = st.selectbox("Choose a methodology:", ["EV Charging (VM0038)", "Fleet Efficiency (VMR0004)", "Solid Waste Recycling (VMR0007)", "Portfolio (batch)"])
         if tool == "EV Charging (VM0038)":
             run_ev_charging_calculator()
         elif tool == "Fleet Efficiency (VMR0004)":
             run_fleet_efficiency_calculator()
         elif tool == "Solid Waste Recycling (VMR0007)":
             run_solid_waste_calculator()
+        elif tool == "Portfolio (batch)":
+            run_portfolio_scoring()
 
 if __name__ == "__main__":
     main()
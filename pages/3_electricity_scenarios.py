@@ -1,7 +1,11 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from statsmodels.tsa.arima.model import ARIMA
+from chart_data import cached_spec, chart_payload
+from forecast_store import BAND_QUANTILES, FORECAST_STORE
+from job_runner import background
+from result_cache import make_key
+from scenario_engine import attach_trajectories
 import altair as alt
 
 st.set_page_config(page_title="Electricity Scenarios", layout="wide")
@@ -41,49 +45,88 @@ years_hist = list(range(2013,2024))
 # ========================
 # 2. Forecast + scenarios
 # ========================
-def make_forecast(prices, sector_name):
-    series = pd.Series(prices, index=years_hist)
-    model = ARIMA(series, order=(1,1,1))
-    fit = model.fit()
-    future_years = list(range(2024,2036))
-    forecast = fit.forecast(steps=len(future_years))
-    forecast.index = future_years
-    
-    n = len(forecast)
-    irp_mult = np.linspace(1.0, 0.85, n)
-    accel_mult = np.linspace(1.0, 0.70, n)
+future_years = list(range(2024,2036))
+histories = {sector: pd.Series(prices, index=years_hist) for sector, prices in hist_data.items()}
+
+model_choice = st.sidebar.radio(
+    "Forecast model",
+    ["ARIMA(1,1,1)", "Auto-select by AIC", "Auto-select by BIC"],
+    help="Auto-select grid-searches ARIMA(p,d,q) orders for every sector in parallel and keeps the best fit."
+)
+if model_choice == "ARIMA(1,1,1)":
+    orders = {sector: (1,1,1) for sector in histories}
+else:
+    criterion = "aic" if "AIC" in model_choice else "bic"
+
+    def search_job(job, histories, steps, criterion):
+        # Runs on the shared job runner; new fits go to the forecast store as they finish
+        return FORECAST_STORE.select_orders(
+            histories, steps=steps, criterion=criterion,
+            progress=lambda done, total: job.report(done / total, f"Fitted {done} / {total} ARIMA models"),
+        )
+
+    search_key = make_key(kind="arima_select", criterion=criterion, steps=len(future_years),
+                          histories={sector: [list(series.index), series.tolist()] for sector, series in histories.items()})
+    with st.sidebar:
+        selection = background("arima_selection", "ARIMA order search", search_job, histories,
+                               len(future_years), criterion, key=search_key)
+    orders = {sector: tuple(entry['order']) for sector, entry in selection.items()}
+    with st.sidebar.expander("Selected models"):
+        st.dataframe(pd.DataFrame({
+            'Sector': list(selection),
+            'Order': [str(tuple(e['order'])) for e in selection.values()],
+            criterion.upper(): [round(e[criterion], 1) for e in selection.values()],
+            'Fit (ms)': [round(e['fit_seconds'] * 1000) for e in selection.values()],
+        }), hide_index=True)
+
+# Price multipliers applied on top of the BAU forecast
+n_future = len(future_years)
+scenario_multipliers = {
+    'BAU': np.ones(n_future),
+    'IRP': np.linspace(1.0, 0.85, n_future),
+    'Accelerated': np.linspace(1.0, 0.70, n_future),
+}
+
+def make_forecast(series, sector_name, order):
+    # Fitted once per unique (history, order); later reruns are served from the store
+    forecast = FORECAST_STORE.forecast(series, order=order, steps=len(future_years), future_index=future_years)
     
     df_hist = pd.DataFrame({'Year': series.index, 'Sector': sector_name, 'Scenario': 'Historical', 'Price': series.values})
-    df_bau = pd.DataFrame({'Year': forecast.index, 'Sector': sector_name, 'Scenario': 'BAU', 'Price': forecast.values})
-    df_irp = pd.DataFrame({'Year': forecast.index, 'Sector': sector_name, 'Scenario': 'IRP', 'Price': forecast.values * irp_mult})
-    df_accel = pd.DataFrame({'Year': forecast.index, 'Sector': sector_name, 'Scenario': 'Accelerated', 'Price': forecast.values * accel_mult})
+    df_scenarios = [
+        pd.DataFrame({'Year': forecast.index, 'Sector': sector_name, 'Scenario': scenario, 'Price': forecast.values * mult})
+        for scenario, mult in scenario_multipliers.items()
+    ]
     
-    return pd.concat([df_hist, df_bau, df_irp, df_accel], ignore_index=True)
-
-res = make_forecast(hist_data['Residential'], 'Residential')
-biz = make_forecast(hist_data['Business'], 'Business')
-ind = make_forecast(hist_data['Industrial'], 'Industrial')
-df = pd.concat([res, biz, ind], ignore_index=True)
+    return pd.concat([df_hist, *df_scenarios], ignore_index=True)
+
+def make_bands(series, sector_name, order):
+    # Percentile bands from thousands of simulated ARIMA paths (computed once, cached),
+    # scaled by every scenario multiplier in one broadcast: (scenarios, percentiles, years)
+    bands = FORECAST_STORE.bands(series, order=order, steps=len(future_years), quantiles=BAND_QUANTILES)
+    multipliers = np.stack(list(scenario_multipliers.values()))
+    scaled = multipliers[:, None, :] * bands[None, :, :]
+    n_scen = len(scenario_multipliers)
+    out = pd.DataFrame({
+        'Year': np.tile(future_years, n_scen),
+        'Sector': sector_name,
+        'Scenario': np.repeat(list(scenario_multipliers), n_future),
+    })
+    for i, q in enumerate(BAND_QUANTILES):
+        out[f'P{round(q * 100)}'] = scaled[:, i, :].ravel()
+    return out
+
+df = pd.concat([make_forecast(series, sector, orders[sector]) for sector, series in histories.items()], ignore_index=True)
+
+show_bands = st.sidebar.checkbox("Show uncertainty bands", help="5–95% and 25–75% ranges from simulated ARIMA price paths.")
+if show_bands:
+    bands_df = pd.concat([make_bands(series, sector, orders[sector]) for sector, series in histories.items()], ignore_index=True)
 
 # ========================
 # 3. Add CO₂ intensities (fixed: BAU flat at 0.85)
 # ========================
 fossil_targets = {"BAU": 0.85, "IRP": 0.40, "Accelerated": 0.30}
-df['FossilShare'] = np.nan
-
-for scenario, target in fossil_targets.items():
-    mask = df['Scenario'] == scenario
-    if mask.any():
-        unique_years = sorted(df.loc[mask, 'Year'].unique())
-        n = len(unique_years)
-        if scenario == "BAU":
-            df.loc[mask, 'FossilShare'] = 0.85
-        else:
-            decline = np.linspace(0.85, target, n)
-            for year, val in zip(unique_years, decline):
-                df.loc[(df['Scenario']==scenario) & (df['Year']==year), 'FossilShare'] = val
-
-df.loc[df['Scenario']=='Historical','FossilShare'] = 0.85
+# Historical has no target, so it stays at the 0.85 starting share
+df = attach_trajectories(df, fossil_targets, start=0.85, period_col='Year', value_col='FossilShare')
 df['CO2_kg_per_kWh'] = df['FossilShare']
 
 # ========================
@@ -113,27 +156,42 @@ if view_mode == "🔍 View one sector":
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Electricity Price")
-        chart_price = (
-            alt.Chart(filtered)
-            .mark_line(point=True)
-            .encode(
-                x='Year:O', y=alt.Y('Price', title='c/kWh'),
-                color='Scenario', tooltip=['Year','Scenario','Price']
+        def price_chart(lines, band=None):
+            chart = (
+                alt.Chart(lines)
+                .mark_line(point=True)
+                .encode(
+                    x='Year:O', y=alt.Y('Price', title='c/kWh'),
+                    color='Scenario', tooltip=['Year','Scenario','Price']
+                )
             )
-        )
-        st.altair_chart(chart_price, use_container_width=True)
+            if band is None:
+                return chart
+            outer = alt.Chart(band).mark_area(opacity=0.15).encode(x='Year:O', y='P5', y2='P95')
+            inner = alt.Chart(band).mark_area(opacity=0.3).encode(
+                x='Year:O', y='P25', y2='P75', tooltip=['Year','P5','P25','P50','P75','P95']
+            )
+            return outer + inner + chart
+
+        frames = [chart_payload(filtered, ['Scenario'], 'Year', 'Price')]
+        if show_bands:
+            frames.append(bands_df[(bands_df['Sector']==sector) & (bands_df['Scenario']==scenario)]
+                          .drop(columns=['Sector', 'Scenario']))
+        st.vega_lite_chart(cached_spec('sector_price', frames, price_chart), width="stretch")
 
     with col2:
         st.subheader("CO₂ Intensity")
-        chart_co2 = (
-            alt.Chart(filtered)
-            .mark_line(point=True)
-            .encode(
-                x='Year:O', y=alt.Y('CO2_kg_per_kWh', title='kg CO₂/kWh'),
-                color='Scenario', tooltip=['Year','Scenario','CO2_kg_per_kWh']
+        def co2_chart(lines):
+            return (
+                alt.Chart(lines)
+                .mark_line(point=True)
+                .encode(
+                    x='Year:O', y=alt.Y('CO2_kg_per_kWh', title='kg CO₂/kWh'),
+                    color='Scenario', tooltip=['Year','Scenario','CO2_kg_per_kWh']
+                )
             )
-        )
-        st.altair_chart(chart_co2, use_container_width=True)
+        payload = chart_payload(filtered, ['Scenario'], 'Year', 'CO2_kg_per_kWh')
+        st.vega_lite_chart(cached_spec('sector_co2', [payload], co2_chart), width="stretch")
 
     # ========================
     # 6. 2035 Summary Cards
@@ -153,57 +211,39 @@ elif view_mode == "Compare all sectors":
     scenario = st.selectbox("Select Scenario", ['BAU','IRP','Accelerated'])
     metric = st.radio("Select metric to compare:", ["Price (c/kWh)", "CO₂ Intensity (kg CO₂/kWh)"])
     compare_df = df[(df['Scenario']==scenario)]
-    
-    if "Price" in metric:
-        chart = (
-            alt.Chart(compare_df)
-            .mark_line(point=True)
-            .encode(
-                x='Year:O', y=alt.Y('Price', title='c/kWh'),
-                color='Sector', tooltip=['Year','Sector','Price']
-            )
-        )
-    else:
-        chart = (
-            alt.Chart(compare_df)
+    column, title = ('Price', 'c/kWh') if "Price" in metric else ('CO2_kg_per_kWh', 'kg CO₂/kWh')
+
+    def compare_chart(data):
+        return (
+            alt.Chart(data)
             .mark_line(point=True)
             .encode(
-                x='Year:O', y=alt.Y('CO2_kg_per_kWh', title='kg CO₂/kWh'),
-                color='Sector', tooltip=['Year','Sector','CO2_kg_per_kWh']
+                x='Year:O', y=alt.Y(column, title=title),
+                color='Sector', tooltip=['Year','Sector',column]
             )
         )
-    st.altair_chart(chart, use_container_width=True)
+    payload = chart_payload(compare_df, ['Sector'], 'Year', column)
+    st.vega_lite_chart(cached_spec('compare', [payload], compare_chart, column=column), width="stretch")
 
 elif view_mode == "🌍 Overlay everything":
     st.markdown("**Overlay all sectors and scenarios for a complete comparison.**")
     metric = st.radio("Select metric:", ["Price (c/kWh)", "CO₂ Intensity (kg CO₂/kWh)"])
     
     plot_df = df[df['Scenario'] != "Historical"]  # keep clean by skipping historical here
-    
-    if "Price" in metric:
-        chart = (
-            alt.Chart(plot_df)
-            .mark_line()
-            .encode(
-                x='Year:O',
-                y=alt.Y('Price', title='c/kWh'),
-                color='Sector',
-                strokeDash='Scenario',
-                tooltip=['Year','Sector','Scenario','Price']
-            )
-        )
-    else:
-        chart = (
-            alt.Chart(plot_df)
+    column, title = ('Price', 'c/kWh') if "Price" in metric else ('CO2_kg_per_kWh', 'kg CO₂/kWh')
+
+    def overlay_chart(data):
+        return (
+            alt.Chart(data)
             .mark_line()
             .encode(
                 x='Year:O',
-                y=alt.Y('CO2_kg_per_kWh', title='kg CO₂/kWh'),
+                y=alt.Y(column, title=title),
                 color='Sector',
                 strokeDash='Scenario',
-                tooltip=['Year','Sector','Scenario','CO2_kg_per_kWh']
+                tooltip=['Year','Sector','Scenario',column]
             )
         )
-    st.altair_chart(chart, use_container_width=True)
-
-
+    # One row per (sector, scenario, year), thinned to the point budget before serialising
+    payload = chart_payload(plot_df, ['Sector', 'Scenario'], 'Year', column)
+    st.vega_lite_chart(cached_spec('overlay', [payload], overlay_chart, column=column), width="stretch")
@@ -1,143 +1,76 @@
 import streamlit as st
-import sqlite3, json, os, pandas as pd, string
-
-# ---------- Config ----------
-JSON_PATH = "carbon_glossary.json"   # keep this in your repo (source of truth)
-DB_PATH = "carbon_glossary_runtime.db"  # runtime-only; safe to ignore in Git
+import os, string
+from glossary_db import (DB_PATH, JSON_PATH, LETTER_GROUPS, PAGE_SIZE, categories, entry_body, letter_pages,
+                         needs_sync, search, sync_glossary)
+from glossary_spelling import spelling_index, suggest
+from job_runner import background
 
 st.set_page_config(page_title="Carbon Glossary", page_icon="🌍", layout="wide")
 
-# ---------- DB init from JSON ----------
-def init_db_from_json(json_path=JSON_PATH, db_path=DB_PATH):
-    # Load JSON
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
-    # Fresh tables
-    cur.execute("DROP TABLE IF EXISTS glossary")
-    cur.execute("""
-        CREATE TABLE glossary(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            term TEXT,
-            category TEXT,
-            definition TEXT,
-            example TEXT,
-            greenwash_watch TEXT
-        )
-    """)
-
-    # Insert rows
-    for row in data:
-        cur.execute("""
-            INSERT INTO glossary (term, category, definition, example, greenwash_watch)
-            VALUES (?, ?, ?, ?, ?)
-        """, (row.get("term",""), row.get("category",""), row.get("definition",""),
-              row.get("example",""), row.get("greenwash_watch","")))
-
-    # FTS index
-    cur.execute("DROP TABLE IF EXISTS glossary_fts")
-    cur.execute("""
-        CREATE VIRTUAL TABLE glossary_fts USING fts5(
-            term, definition, example, greenwash_watch,
-            content='glossary', content_rowid='id'
-        )
-    """)
-    cur.execute("""
-        INSERT INTO glossary_fts(rowid, term, definition, example, greenwash_watch)
-        SELECT id, term, definition, example, greenwash_watch FROM glossary
-    """)
-
-    conn.commit()
-    conn.close()
+RESULT_LIMIT = 50  # search matches shown; browsing pages through PAGE_SIZE per letter
+
+# ---------- DB sync from JSON ----------
+def sync_job(job, json_path, db_path):
+    job.report(0.0, "Updating glossary index...")
+    result = sync_glossary(json_path, db_path)
+    # Rebuild the "did you mean" dictionary with the index it is drawn from
+    job.report(0.9, "Updating spelling suggestions...")
+    spelling_index(db_path)
+    return result
+
+def use_suggestion(text):
+    st.session_state["glossary_q"] = text
 
 def ensure_db():
-    # Build DB at runtime if missing or JSON newer than DB
-    build_needed = (not os.path.exists(DB_PATH))
-    if not build_needed:
-        json_mtime = os.path.getmtime(JSON_PATH) if os.path.exists(JSON_PATH) else 0
-        db_mtime = os.path.getmtime(DB_PATH)
-        if json_mtime > db_mtime:
-            build_needed = True
-    if build_needed:
-        init_db_from_json()
+    # Sync the DB with the JSON when the file changed; only changed terms are rewritten,
+    # and other sessions keep reading the previous version until the sync commits
+    if needs_sync(JSON_PATH, DB_PATH):
+        signature = os.stat(JSON_PATH)
+        background("glossary_sync", "Glossary index sync", sync_job, JSON_PATH, DB_PATH,
+                   key=f"glossary:{signature.st_mtime_ns}:{signature.st_size}")
 
 # ---------- Query helpers ----------
+# Every helper below is served from the glossary query cache, keyed on the index
+# version, so repeat browsing and searches skip SQLite until the JSON changes
 def load_categories():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT DISTINCT category FROM glossary ORDER BY category", conn)
-    conn.close()
-    return ["All"] + df["category"].dropna().tolist()
+    return ["All"] + categories()
 
 def search_terms(query, category=None, start_letter=None):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    # Build base SQL using FTS with relevance ranking (bm25: lower = better)
-    base_sql = """
-    SELECT g.term, g.category, g.definition, g.example, g.greenwash_watch,
-           bm25(glossary_fts) as rank
-    FROM glossary g
-    JOIN glossary_fts f ON g.id = f.rowid
-    WHERE f MATCH ?
-    """
-    params = [f'"{query}"'] if query else ['*']  # '*' matches everything in FTS
-
-    # Filters
-    if category and category != "All":
-        base_sql += " AND g.category = ?"
-        params.append(category)
-    if start_letter and start_letter in string.ascii_uppercase:
-        base_sql += " AND UPPER(SUBSTR(g.term,1,1)) = ?"
-        params.append(start_letter.upper())
-
-    base_sql += " ORDER BY rank ASC, g.term COLLATE NOCASE ASC"
-
-    try:
-        cur.execute(base_sql, params)
-        results = cur.fetchall()
-        conn.close()
-        return results
-    except sqlite3.OperationalError:
-        # Fallback to LIKE search if FTS parsing fails
-        like_sql = """
-        SELECT term, category, definition, example, greenwash_watch, 0 as rank
-        FROM glossary
-        WHERE 1=1
-        """
-        like_params = []
-        if query:
-            like_sql += " AND (term LIKE ? OR definition LIKE ? OR example LIKE ? OR greenwash_watch LIKE ?)"
-            like_q = f"%{query}%"
-            like_params += [like_q, like_q, like_q, like_q]
-        if category and category != "All":
-            like_sql += " AND category = ?"
-            like_params.append(category)
-        if start_letter and start_letter in string.ascii_uppercase:
-            like_sql += " AND UPPER(SUBSTR(term,1,1)) = ?"
-            like_params.append(start_letter.upper())
-
-        like_sql += " ORDER BY term COLLATE NOCASE ASC"
-        cur.execute(like_sql, like_params)
-        results = cur.fetchall()
-        conn.close()
-        return results
+    # Partial words match as you type ("addit" -> Additionality), served from the
+    # prefix and trigram indexes; at most RESULT_LIMIT (id, term, category) rows, best first
+    return search(query, category=category, start_letter=start_letter, limit=RESULT_LIMIT)
 
 def group_by_letter(rows):
-    # rows: tuples (term, category, definition, example, greenwash, rank)
+    # rows: tuples (id, term, category)
     grouped = {}
     for r in rows:
-        term = str(r[0]) if r[0] else ""
+        term = str(r[1]) if r[1] else ""
         letter = term[:1].upper() if term else "?"
-        if not letter.isalpha():
+        if not ("A" <= letter <= "Z"):
             letter = "#"
         grouped.setdefault(letter, []).append(r)
     # sort letters A-Z, with '#' last
     keys = sorted([k for k in grouped.keys() if k != "#"]) + (["#"] if "#" in grouped else [])
     return [(k, grouped[k]) for k in keys]
 
+def render_entry(entry_id, term, cat):
+    # The body is only read from the DB while the expander is open
+    expander = st.expander(f"{term}  ·  {cat}", key=f"entry_{entry_id}", on_change="rerun")
+    if expander.open:
+        definition, example, greenwash = entry_body(entry_id)
+        with expander:
+            st.markdown(f"**Definition**  \n{definition}")
+            if example:
+                st.markdown(f"**Example**  \n{example}")
+            if greenwash:
+                st.markdown(f"**⚠️ Greenwash Watch**  \n{greenwash}")
+
+def page_buttons(letter, stack, has_next, last_key):
+    # stack lives in session_state, so the callbacks move this letter's cursor directly
+    prev_col, next_col, _ = st.columns([1, 1, 6])
+    prev_col.button("◀ Previous", key=f"prev_{letter}", disabled=len(stack) == 1, on_click=stack.pop)
+    next_col.button("Next ▶", key=f"next_{letter}", disabled=not has_next, on_click=stack.append, args=(last_key,))
+
 # ---------- App ----------
 # Ensure DB exists from JSON
 if not os.path.exists(JSON_PATH):
@@ -152,34 +85,55 @@ st.write("Quick reference for the most important terms in **carbon markets**, **
 # Controls
 cols = st.columns([2, 1, 1])
 with cols[0]:
-    q = st.text_input("Search", placeholder="Try: additionality, CBAM, double counting, REC, etc.")
+    q = st.text_input("Search", placeholder="Try: additionality, CBAM, double counting, REC, etc.", key="glossary_q")
 with cols[1]:
     category = st.selectbox("Category", load_categories(), index=0)
 with cols[2]:
     letters = ["All"] + list(string.ascii_uppercase)
     jump_letter = st.selectbox("A–Z", letters, index=0)
 
-# Fetch
 start_letter = None if jump_letter == "All" else jump_letter
-rows = search_terms(q.strip() if q else None, category=None if category == "All" else category, start_letter=start_letter)
+category = None if category == "All" else category
+q = q.strip() if q else ""
 
-# Display
-if not rows:
-    if q:
+# Search: at most RESULT_LIMIT matches, grouped A–Z
+if q:
+    rows = search_terms(q, category=category, start_letter=start_letter)
+    if not rows:
         st.warning(f"🔎 '{q}' not currently in glossary.")
-    else:
-        st.info("Use the search bar, category, or A–Z filter to explore terms.")
+        suggestions = suggest(q)
+        if suggestions:
+            st.write("Did you mean:")
+            for i, (col, text) in enumerate(zip(st.columns(len(suggestions)), suggestions)):
+                col.button(text, key=f"suggestion_{i}", on_click=use_suggestion, args=(text,))
+        st.stop()
+    if len(rows) == RESULT_LIMIT:
+        st.caption(f"Showing the first {RESULT_LIMIT} matches. Keep typing to narrow them down.")
+    for letter, terms in group_by_letter(rows):
+        st.subheader(letter)
+        for entry_id, term, cat in terms:
+            render_entry(entry_id, term, cat)
     st.stop()
 
-# Group A–Z and render with expanders per term (neat, not cluttered)
-for letter, terms in group_by_letter(rows):
-    st.subheader(letter)
-    for r in terms:
-        term, cat, definition, example, greenwash, _rank = r
-        with st.expander(f"{term}  ·  {cat}"):
-            st.markdown(f"**Definition**  \n{definition}")
-            if example:
-                st.markdown(f"**Example**  \n{example}")
-            if greenwash:
-                st.markdown(f"**⚠️ Greenwash Watch**  \n{greenwash}")
+# Browse: one page of PAGE_SIZE terms per letter group, keyset-paged on the entry key.
+# glossary_cursors[(category, letter)] is the stack of keys each visited page starts after.
+cursors = st.session_state.setdefault("glossary_cursors", {})
+groups = [start_letter] if start_letter else list(LETTER_GROUPS)
+stacks = {letter: cursors.setdefault((category, letter), [None]) for letter in groups}
+pages = letter_pages({letter: stack[-1] for letter, stack in stacks.items()}, category=category)
+
+if not any(pages.values()):
+    st.info("Use the search bar, category, or A–Z filter to explore terms.")
+    st.stop()
 
+for letter, rows in pages.items():
+    if not rows:
+        continue
+    stack = stacks[letter]
+    has_next = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    st.subheader(letter)
+    for entry_id, _key, term, cat in rows:
+        render_entry(entry_id, term, cat)
+    if has_next or len(stack) > 1:
+        page_buttons(letter, stack, has_next, rows[-1][1])
@@ -1,7 +1,15 @@
+import io
+import os
 import streamlit as st
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
-import numpy_financial as npf  # for IRR calculation
+from job_runner import background
+from monte_carlo import (SIMULATION_CACHE, cached_npv_sobol_indices, cached_simulation,
+                         replicate_std_error, running_mean, sensitivity_inputs, simulation_key, sobol_key,
+                         stream_simulation)
+from result_cache import make_key
+from samplers import SAMPLER_LABELS
 
 st.header("📊 Monte Carlo Simulator: NPV, ROI & IRR")
 
@@ -16,7 +24,7 @@ plus a sensitivity analysis to see what drives results.
 # ========================
 st.subheader("Set Input Ranges")
 
-years = st.slider("Project duration (years)", 1, 10, 5)
+years = st.slider("Project duration (years)", 1, 30, 5)
 
 sales_min, sales_max = st.slider("Annual sales volume range (units)", 100, 10000, (1000, 2000))
 price_min, price_max = st.slider("Price per unit range", 10, 500, (80, 120))
@@ -34,114 +42,262 @@ if discount_rate == "Custom":
 else:
     dr = float(discount_rate.split("%")[0]) / 100
 
-simulations = st.number_input("Number of Monte Carlo trials", min_value=1000, max_value=20000, value=5000, step=1000)
+time_varying = st.checkbox(
+    "Time-varying cashflows",
+    help="Give every trial its own yearly cashflow path instead of repeating year 1's cashflow.",
+)
+if time_varying:
+    col1, col2, col3 = st.columns(3)
+    growth = col1.slider("Annual growth (%)", -10.0, 15.0, 3.0, 0.5) / 100
+    volatility = col2.slider("Yearly volatility (%)", 0.0, 50.0, 15.0, 1.0) / 100
+    persistence = col3.slider("Year-to-year correlation", 0.0, 0.95, 0.5, 0.05,
+                              help="How strongly a good or bad year carries over into the next.")
+    cashflow_model = {"growth": growth, "volatility": volatility, "correlation": persistence}
+else:
+    cashflow_model = None
+
+sampler = st.selectbox(
+    "Sampling method",
+    list(SAMPLER_LABELS),
+    format_func=SAMPLER_LABELS.get,
+    help="Latin hypercube and Sobol spread trials evenly over the input ranges, so results settle with far fewer trials.",
+)
+
+mode = st.radio(
+    "Simulation mode",
+    ["Standard", "Streaming (very large trial counts)"],
+    horizontal=True,
+    help="Streaming mode runs trials in chunks and keeps only summary statistics, so memory stays constant.",
+)
+streaming = mode.startswith("Streaming")
+
+if streaming:
+    simulations = st.number_input("Number of Monte Carlo trials", min_value=1000000, max_value=100000000, value=10000000, step=1000000)
+    max_workers = os.cpu_count() or 1
+    workers = st.slider("Worker processes", 1, max_workers, min(4, max_workers),
+                        help="Trials are split across processes; results are identical for any worker count.") if max_workers > 1 else 1
+else:
+    simulations = st.number_input("Number of Monte Carlo trials", min_value=1000, max_value=1000000, value=5000, step=1000)
+
+params = (years, (sales_min, sales_max), (price_min, price_max), (cost_min, cost_max), initial_investment, dr)
 
 # ========================
-# Monte Carlo Simulation
+# Display helpers
 # ========================
-np.random.seed(42)  # reproducibility
+def show_metrics(stats):
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Average NPV", f"{stats['avg_npv']:,.0f}")
+    col2.metric("Probability NPV > 0", f"{stats['prob_npv_positive'] * 100:.1f}%")
+    col3.metric("Average ROI", f"{stats['avg_roi']:.2f}")
 
-sales = np.random.uniform(sales_min, sales_max, simulations)
-prices = np.random.uniform(price_min, price_max, simulations)
-costs = np.random.uniform(cost_min, cost_max, simulations)
+    col4, col5 = st.columns(2)
+    if stats["avg_irr"] is not None:
+        col4.metric("Average IRR", f"{stats['avg_irr'] * 100:.1f}%")
+    if stats["avg_breakeven"] is not None:
+        col5.metric("Avg Break-even Sales", f"{stats['avg_breakeven']:,.0f} units/yr")
 
-revenues = sales * prices
-expenses = sales * costs
-annual_cashflows = revenues - expenses  # profit before investment
+def show_figure(cache_key, draw):
+    # Standard-mode figures are cached as PNGs next to the simulation results, so
+    # reruns that don't change the inputs (e.g. opening the expander) skip matplotlib
+    if cache_key is None:
+        fig = draw()
+        st.pyplot(fig)
+        plt.close(fig)
+        return
 
-npvs, rois, irrs, breakeven_sales = [], [], [], []
+    def render():
+        fig = draw()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=200, bbox_inches="tight")
+        plt.close(fig)
+        return {"png": np.frombuffer(buf.getvalue(), dtype=np.uint8)}
 
-for i in range(simulations):
-    yearly_cf = annual_cashflows[i]
-    # Discounted cashflows for NPV
-    discounted = [yearly_cf / ((1 + dr) ** t) for t in range(1, years + 1)]
-    npv = sum(discounted) - initial_investment
-    npvs.append(npv)
+    st.image(SIMULATION_CACHE.get_or_compute(cache_key, render)["png"].tobytes())
 
-    # ROI (total inflows vs investment)
-    total_inflows = yearly_cf * years
-    roi = (total_inflows - initial_investment) / initial_investment
-    rois.append(roi)
+def figure_key(stats, name):
+    return f"{stats['key']}-{name}" if stats.get("key") else None
 
-    # IRR (cashflow stream: -investment, then yearly CFs)
-    cashflows = [-initial_investment] + [yearly_cf] * years
-    try:
-        irr = npf.irr(cashflows)
-        if irr is not None and not np.isnan(irr):
-            irrs.append(irr)
-    except:
-        continue
+def show_distributions(stats):
+    # NPV Histogram
+    def draw_npv():
+        counts, edges = stats["npv_hist"]
+        fig, ax = plt.subplots()
+        ax.stairs(counts, edges, fill=True, color="skyblue", edgecolor="black")
+        ax.axvline(stats["avg_npv"], color="red", linestyle="dashed", linewidth=2, label=f"Mean NPV = {stats['avg_npv']:,.0f}")
+        ax.set_title("NPV Distribution")
+        ax.set_xlabel("NPV")
+        ax.set_ylabel("Frequency")
+        ax.legend()
+        return fig
+    show_figure(figure_key(stats, "npv_hist"), draw_npv)
+
+    # IRR Histogram
+    if stats["avg_irr"] is not None:
+        def draw_irr():
+            counts, edges = stats["irr_hist"]
+            fig, ax = plt.subplots()
+            ax.stairs(counts, edges * 100, fill=True, color="lightgreen", edgecolor="black")
+            ax.axvline(stats["avg_irr"] * 100, color="red", linestyle="dashed", linewidth=2, label=f"Mean IRR = {stats['avg_irr'] * 100:.1f}%")
+            ax.set_title("IRR Distribution")
+            ax.set_xlabel("IRR (%)")
+            ax.set_ylabel("Frequency")
+            ax.legend()
+            return fig
+        show_figure(figure_key(stats, "irr_hist"), draw_irr)
+
+def stats_from_trials(results):
+    npvs = results["npvs"]
+    # Trials without an IRR (no sign change in the cashflows) are left out
+    irrs = results["irrs"][np.isfinite(results["irrs"])]
+    breakeven_sales = results["breakeven_sales"][np.isfinite(results["breakeven_sales"])]
+
+    # Correlation of inputs with NPV
+    data_matrix = np.vstack([results["sales"], results["prices"], results["costs"], npvs]).T
+    corr = np.corrcoef(data_matrix, rowvar=False)
+    labels = ["Sales", "Price", "Cost", "NPV"]
+
+    return {
+        "avg_npv": np.mean(npvs),
+        "prob_npv_positive": np.mean(npvs > 0),
+        "avg_roi": np.mean(results["rois"]),
+        "avg_irr": np.mean(irrs) if len(irrs) > 0 else None,
+        "avg_breakeven": np.mean(breakeven_sales) if len(breakeven_sales) > 0 else None,
+        "npv_hist": np.histogram(npvs, bins=40),
+        "irr_hist": np.histogram(irrs, bins=40) if len(irrs) > 0 else None,
+        "npv_corr": dict(zip(labels[:-1], corr[-1, :-1])),
+        "se_npv": replicate_std_error(npvs, results["replicates"]),
+        "se_prob": replicate_std_error(npvs > 0, results["replicates"]),
+    }
 
-    # Break-even sales volume (NPV=0 approx)
-    margin = prices[i] - costs[i]
-    if margin > 0:
-        pv_factor = sum([1 / ((1 + dr) ** t) for t in range(1, years + 1)])
-        required_sales = initial_investment / (margin * pv_factor)
-        breakeven_sales.append(required_sales)
+def stats_from_summary(summary):
+    return {
+        "avg_npv": summary.mean_npv(),
+        "prob_npv_positive": summary.prob_npv_positive(),
+        "avg_roi": summary.rois.mean[0] if summary.rois.count else np.nan,
+        "avg_irr": summary.irrs.mean[0] if summary.irrs.count else None,
+        "avg_breakeven": summary.breakeven_sales.mean[0] if summary.breakeven_sales.count else None,
+        "npv_hist": (summary.npv_hist.counts, summary.npv_hist.edges),
+        "irr_hist": (summary.irr_hist.counts, summary.irr_hist.edges),
+        "npv_corr": summary.npv_correlations(),
+        "se_npv": summary.std_errors()[0],
+        "se_prob": summary.std_errors()[1],
+    }
 
-npvs = np.array(npvs)
-rois = np.array(rois)
-irrs = np.array(irrs)
-breakeven_sales = np.array(breakeven_sales)
+# ========================
+# Background jobs
+# ========================
+# Simulations run on the shared job runner, so a long run never blocks this
+# session's script thread or other sessions; results land in session state.
+def simulation_job(job, *args, **kwargs):
+    job.report(0.0, "Simulating trials...")
+    return cached_simulation(*args, **kwargs)[1]
+
+def streaming_job(job, *args, simulations, **kwargs):
+    stream = stream_simulation(*args, simulations, **kwargs)
+    try:
+        for summary in stream:
+            job.report(summary.count / simulations, f"{summary.count:,} / {simulations:,} trials", partial=summary)
+    finally:
+        stream.close()  # stops the worker pool promptly on cancel
+    return summary
+
+def sobol_job(job, *args, **kwargs):
+    job.report(0.0, "Computing Sobol indices...")
+    return cached_npv_sobol_indices(*args, **kwargs)
 
 # ========================
-# Results
+# Monte Carlo Simulation
 # ========================
 st.subheader("Simulation Results")
 
-col1, col2, col3 = st.columns(3)
-col1.metric("Average NPV", f"{np.mean(npvs):,.0f}")
-col2.metric("Probability NPV > 0", f"{(np.mean(npvs > 0) * 100):.1f}%")
-col3.metric("Average ROI", f"{np.mean(rois):.2f}")
+if streaming:
+    # Partial results are redrawn after each chunk and sharpen as trials accumulate
+    stream_key = make_key(kind="stream", params=params, simulations=int(simulations), seed=42,
+                          sampler=sampler, cashflow_model=cashflow_model)
+    summary = background("mc_stream", "Streaming simulation", streaming_job, *params,
+                         simulations=int(simulations), seed=42, workers=workers, sampler=sampler,
+                         cashflow_model=cashflow_model, key=stream_key,
+                         show_partial=lambda partial: show_metrics(stats_from_summary(partial)))
+    stats = stats_from_summary(summary)
+    show_metrics(stats)
 
-col4, col5 = st.columns(2)
-if len(irrs) > 0:
-    col4.metric("Average IRR", f"{np.mean(irrs) * 100:.1f}%")
-if len(breakeven_sales) > 0:
-    col5.metric("Avg Break-even Sales", f"{np.mean(breakeven_sales):,.0f} units/yr")
+    p5, p50, p95 = summary.npv_sketch.quantile([0.05, 0.5, 0.95])
+    st.caption(f"NPV percentiles (approx.): P5 {p5:,.0f} · P50 {p50:,.0f} · P95 {p95:,.0f}")
+else:
+    # Cached on the inputs, seed and sampler, so repeat views skip the simulation
+    key = simulation_key(*params, int(simulations), seed=42, sampler=sampler, cashflow_model=cashflow_model)
+    results = SIMULATION_CACHE.get(key)
+    if results is None:
+        results = background("mc_trials", "Monte Carlo simulation", simulation_job, *params, int(simulations),
+                             seed=42, sampler=sampler, cashflow_model=cashflow_model, key=key)
+    stats = stats_from_trials(results)
+    stats["key"] = key
+    show_metrics(stats)
 
 # ========================
 # Plots
 # ========================
 st.subheader("Distributions")
+show_distributions(stats)
 
-# NPV Histogram
-fig, ax = plt.subplots()
-ax.hist(npvs, bins=40, color="skyblue", edgecolor="black")
-ax.axvline(np.mean(npvs), color="red", linestyle="dashed", linewidth=2, label=f"Mean NPV = {np.mean(npvs):,.0f}")
-ax.set_title("NPV Distribution")
-ax.set_xlabel("NPV")
-ax.set_ylabel("Frequency")
-ax.legend()
-st.pyplot(fig)
-
-# IRR Histogram
-if len(irrs) > 0:
-    fig, ax = plt.subplots()
-    ax.hist(irrs * 100, bins=40, color="lightgreen", edgecolor="black")
-    ax.axvline(np.mean(irrs) * 100, color="red", linestyle="dashed", linewidth=2, label=f"Mean IRR = {np.mean(irrs) * 100:.1f}%")
-    ax.set_title("IRR Distribution")
-    ax.set_xlabel("IRR (%)")
-    ax.set_ylabel("Frequency")
-    ax.legend()
-    st.pyplot(fig)
+# ========================
+# Convergence
+# ========================
+st.subheader("Convergence")
+st.caption("Standard errors come from independent replicate batches, so they are valid for every sampling method.")
+
+col1, col2 = st.columns(2)
+col1.metric("Std. error of mean NPV", f"{stats['se_npv']:,.0f}")
+col2.metric("Std. error of P(NPV > 0)", f"{stats['se_prob'] * 100:.2f} pp")
+
+if not streaming:
+    def draw_running_mean():
+        trials, npv_running = running_mean(results["npvs"])
+        fig, ax = plt.subplots()
+        ax.plot(trials, npv_running, color="steelblue")
+        ax.axhline(stats["avg_npv"], color="red", linestyle="dashed", linewidth=1)
+        ax.set_title("Running Mean NPV")
+        ax.set_xlabel("Trials")
+        ax.set_ylabel("Mean NPV")
+        return fig
+    show_figure(figure_key(stats, "running_mean"), draw_running_mean)
 
 # ========================
 # Sensitivity Analysis
 # ========================
 st.subheader("Sensitivity Analysis")
 
-# Correlation of inputs with NPV
-data_matrix = np.vstack([sales, prices, costs, npvs]).T
-corr = np.corrcoef(data_matrix, rowvar=False)
-labels = ["Sales", "Price", "Cost", "NPV"]
-
-# Extract correlations of inputs with NPV
-npv_corr = dict(zip(labels[:-1], corr[-1, :-1]))
-
-for k, v in npv_corr.items():
+for k, v in stats["npv_corr"].items():
     st.write(f"Correlation of {k} with NPV: {v:.2f}")
 
+st.markdown("**Sobol indices** (share of NPV variance explained by each input)")
+base_samples = st.select_slider(
+    "Sobol base samples",
+    options=[2 ** 12, 2 ** 14, 2 ** 16, 2 ** 18],
+    value=2 ** 14,
+    format_func=lambda n: f"{n:,} ({n * (len(sensitivity_inputs(cashflow_model)) + 2):,} model runs)",
+)
+indices = SIMULATION_CACHE.get(sobol_key(*params, base_samples, seed=42, sampler=sampler,
+                                          cashflow_model=cashflow_model))
+if indices is None:
+    indices = background("mc_sobol", "Sobol indices", sobol_job, *params, base_samples, seed=42, sampler=sampler,
+                         cashflow_model=cashflow_model,
+                         key=sobol_key(*params, base_samples, seed=42, sampler=sampler,
+                                       cashflow_model=cashflow_model))
+sobol_table = pd.DataFrame({
+    "Input": sensitivity_inputs(cashflow_model),
+    "First-order": indices["first_order"],
+    "First-order 95% CI": [f"{lo:.3f} – {hi:.3f}" for lo, hi in indices["first_order_ci"]],
+    "Total effect": indices["total_effect"],
+    "Total effect 95% CI": [f"{lo:.3f} – {hi:.3f}" for lo, hi in indices["total_effect_ci"]],
+})
+st.dataframe(sobol_table, hide_index=True, width="stretch")
+st.caption("The gap between total effect and first-order is the share each input contributes through interactions, "
+           "e.g. Sales × (Price − Cost).")
+if cashflow_model is not None:
+    st.caption("With time-varying cashflows, the year-to-year path shocks are treated as one extra noise input "
+               "(Cashflow path): its indices are the share of NPV variance that comes from the random path.")
+
 # ========================
 # Educational Overlay
 # ========================
@@ -149,6 +305,7 @@ with st.expander("💡 What does this mean?"):
     st.markdown("""
     - **Initial Investment:** Upfront capital needed to start the project.  
     - **Cashflows:** Annual profits = (Sales × Price) – (Sales × Cost).  
+      - With time-varying cashflows, each year's profit follows its own path: trend growth plus random shocks that can persist into the next year.  
     - **NPV (Net Present Value):** Discounted value of future profits minus investment.  
       - Positive NPV = project creates value.  
     - **ROI (Return on Investment):**  
@@ -160,6 +317,9 @@ with st.expander("💡 What does this mean?"):
     - **Break-even Sales:** Minimum annual sales needed for NPV = 0 (on average).  
     - **Sensitivity Analysis:** Correlation shows which input has the greatest effect on NPV.  
       - Example: if Price has correlation 0.8, it is the strongest driver of NPV.  
+    - **Sobol Indices:** First-order = share of NPV variance from an input alone; total effect adds its interactions.  
+    - **Sampling Method:** Latin hypercube and Sobol cover the input ranges more evenly than pseudo-random draws.  
+      - Lower standard error for the same number of trials.  
     - **Discount Rate Guidelines:**  
         - 10% → Established, low-risk businesses  
         - 15% → Medium risk ventures  
@@ -0,0 +1,133 @@
+import json
+import time
+import zlib
+
+import pandas as pd
+
+from registry_db import PROJECT_COLUMNS, REGISTRY
+
+# ========================
+# Registry history.
+# Triggers append every insert, update (changed columns only) and delete to
+# project_changes. A compressed snapshot of the whole registry is stored every
+# SNAPSHOT_EVERY events, so rebuilding the registry at a past time means
+# loading one snapshot and replaying only the events after it.
+# ========================
+SNAPSHOT_EVERY = 10_000
+STATE_COLUMNS = [*PROJECT_COLUMNS, "factor_version"]
+
+
+def _apply(state, project_id, op, delta):
+    # Replays one change-log event onto state ({project id: row dict}) in place
+    if op == "insert":
+        state[project_id] = json.loads(delta)
+    elif op == "update":
+        if project_id in state:
+            state[project_id].update(json.loads(delta))
+    elif op == "delete":
+        state.pop(project_id, None)
+    elif op == "revise":
+        # Registry-wide factor revision, logged once instead of once per project
+        change = json.loads(delta)
+        b = change["baseline_intensity"]
+        for row in state.values():
+            if row["industry"] == change["industry"]:
+                row["baseline_intensity"] = b
+                row["estimated_credits"] = b * row["output_tonnes"] - row["actual_emissions"] - row["leakage"]
+                row["factor_version"] = change["factor_version"]
+
+
+def log_revision(conn, industry, baseline_intensity, version):
+    # Called by the recomputation job inside its transaction (the per-row audit trigger is paused)
+    conn.execute(
+        "INSERT INTO project_changes (project_id, ts, op, delta) VALUES (0, ?, 'revise', ?)",
+        (time.time(), json.dumps({"industry": industry, "baseline_intensity": baseline_intensity,
+                                  "factor_version": version})),
+    )
+
+
+def take_snapshot(registry=REGISTRY):
+    # Stores the current registry, compressed, tagged with the last change-log seq it includes
+    with registry.connection() as conn:
+        conn.execute("BEGIN")  # one read transaction: rows and last_seq from the same instant
+        try:
+            last_seq = conn.execute("SELECT IFNULL(MAX(seq), 0) FROM project_changes").fetchone()[0]
+            rows = conn.execute(f"SELECT id, {', '.join(STATE_COLUMNS)} FROM projects ORDER BY id").fetchall()
+        finally:
+            conn.execute("COMMIT")
+    payload = zlib.compress(json.dumps({"columns": ["id", *STATE_COLUMNS], "rows": rows}).encode("utf-8"))
+    with registry.transaction() as conn:
+        conn.execute(
+            "INSERT INTO registry_snapshots (ts, last_seq, projects, data) VALUES (?, ?, ?, ?)",
+            (time.time(), last_seq, len(rows), payload),
+        )
+    return last_seq
+
+
+def snapshot_due(registry=REGISTRY, every=SNAPSHOT_EVERY):
+    # True once `every` events have accumulated since the last snapshot (two index lookups)
+    with registry.connection() as conn:
+        pending = conn.execute("""
+            SELECT IFNULL((SELECT MAX(seq) FROM project_changes), 0)
+                 - IFNULL((SELECT MAX(last_seq) FROM registry_snapshots), 0)
+        """).fetchone()[0]
+    return pending >= every
+
+
+def maybe_snapshot(registry=REGISTRY, every=SNAPSHOT_EVERY):
+    # Takes a snapshot inline if one is due (scripts; the app runs it as a background job)
+    if snapshot_due(registry, every):
+        take_snapshot(registry)
+        return True
+    return False
+
+
+def registry_as_of(ts, registry=REGISTRY):
+    # The registry as it was at Unix time ts, as a DataFrame indexed by project id
+    with registry.connection() as conn:
+        snapshot = conn.execute("""
+            SELECT last_seq, data FROM registry_snapshots
+            WHERE ts <= ? ORDER BY ts DESC LIMIT 1
+        """, (ts,)).fetchone()
+        state = {}
+        last_seq = 0
+        if snapshot:
+            last_seq, data = snapshot
+            decoded = json.loads(zlib.decompress(data))
+            names = decoded["columns"][1:]
+            state = {row[0]: dict(zip(names, row[1:])) for row in decoded["rows"]}
+        events = conn.execute("""
+            SELECT project_id, op, delta FROM project_changes
+            WHERE seq > ? AND ts <= ? ORDER BY seq
+        """, (last_seq, ts))
+        for project_id, op, delta in events:
+            _apply(state, project_id, op, delta)
+    frame = pd.DataFrame.from_dict(state, orient="index", columns=STATE_COLUMNS)
+    frame.index.name = "id"
+    return frame.sort_index()
+
+
+def project_as_of(project_id, ts, registry=REGISTRY):
+    # One project's row at Unix time ts (None if it did not exist), via the (project_id, ts) index
+    with registry.connection() as conn:
+        events = conn.execute("""
+            SELECT project_id, op, delta FROM project_changes
+            WHERE project_id IN (?, 0) AND ts <= ? ORDER BY seq
+        """, (project_id, ts)).fetchall()
+    state = {}
+    for pid, op, delta in events:
+        _apply(state, pid, op, delta)
+    return state.get(project_id)
+
+
+def project_history(project_id, registry=REGISTRY, limit=50):
+    # Newest first: (seq, ts, op, changed columns) for one project
+    with registry.connection() as conn:
+        rows = conn.execute("""
+            SELECT seq, ts, op, delta FROM project_changes
+            WHERE project_id = ? ORDER BY ts DESC, seq DESC LIMIT ?
+        """, (project_id, limit)).fetchall()
+    return [
+        {"seq": seq, "ts": ts, "op": op, "changes": json.loads(delta) if delta else {}}
+        for seq, ts, op, delta in rows
+    ]
@@ -1,9 +1,36 @@
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 
-def init_db():
-    conn = sqlite3.connect("registry.db")
-    c = conn.cursor()
-    c.execute("""
+# ========================
+# Registry data access.
+# One RegistryDB per database file keeps a small pool of open connections
+# shared by every Streamlit session in the process. The schema is created and
+# migrated once, on first use, and tracked with PRAGMA user_version.
+# ========================
+DB_PATH = "registry.db"
+POOL_SIZE = 8
+# How long a writer queues for the write lock before "database is locked". A factor
+# revision holds it for its whole single-transaction update (about 5 s per million projects).
+BUSY_TIMEOUT_MS = 30_000
+INDUSTRIES = ["Cement", "Steel", "Aluminium", "Electricity", "Fertilizer", "Glass", "Pulp & Paper"]
+PROJECT_COLUMNS = ["name", "description", "industry", "baseline_intensity", "output_tonnes",
+                   "actual_emissions", "leakage", "estimated_credits"]
+SORT_COLUMNS = ["id", "name", "industry", "output_tonnes", "estimated_credits"]
+
+# Applied per connection; journal_mode=WAL is persistent and set once in init_schema
+CONNECTION_PRAGMAS = [
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA synchronous=NORMAL",   # safe with WAL, far fewer fsyncs
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",    # ~16 MB page cache
+]
+
+# Schema migrations, applied in order. Version N is reached after MIGRATIONS[N - 1].
+MIGRATIONS = [
+    """
     CREATE TABLE IF NOT EXISTS projects (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT,
@@ -14,46 +41,434 @@ def init_db():
         actual_emissions REAL,
         leakage REAL,
         estimated_credits REAL
-    )
-    """)
-    conn.commit()
-    conn.close()
+    );
+    """,
+    # 2: indexes for filtering, sorting and prefix search, plus per-industry
+    # totals maintained by triggers so aggregates never scan projects
+    """
+    CREATE INDEX IF NOT EXISTS idx_projects_industry ON projects(industry, id);
+    CREATE INDEX IF NOT EXISTS idx_projects_name ON projects(name, id);
+    CREATE INDEX IF NOT EXISTS idx_projects_name_nocase ON projects(name COLLATE NOCASE);
+
+    CREATE TABLE IF NOT EXISTS industry_summary (
+        industry TEXT PRIMARY KEY,
+        project_count INTEGER NOT NULL,
+        total_credits REAL NOT NULL,
+        total_output REAL NOT NULL,
+        total_baseline REAL NOT NULL,
+        total_actual REAL NOT NULL,
+        total_leakage REAL NOT NULL
+    );
+    INSERT OR REPLACE INTO industry_summary
+    SELECT IFNULL(industry, ''), COUNT(*), TOTAL(estimated_credits), TOTAL(output_tonnes),
+           TOTAL(baseline_intensity), TOTAL(actual_emissions), TOTAL(leakage)
+    FROM projects GROUP BY IFNULL(industry, '');
+
+    CREATE TRIGGER IF NOT EXISTS projects_summary_insert AFTER INSERT ON projects BEGIN
+        INSERT INTO industry_summary VALUES (
+            IFNULL(NEW.industry, ''), 1, IFNULL(NEW.estimated_credits, 0), IFNULL(NEW.output_tonnes, 0),
+            IFNULL(NEW.baseline_intensity, 0), IFNULL(NEW.actual_emissions, 0), IFNULL(NEW.leakage, 0))
+        ON CONFLICT(industry) DO UPDATE SET
+            project_count = project_count + 1,
+            total_credits = total_credits + excluded.total_credits,
+            total_output = total_output + excluded.total_output,
+            total_baseline = total_baseline + excluded.total_baseline,
+            total_actual = total_actual + excluded.total_actual,
+            total_leakage = total_leakage + excluded.total_leakage;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS projects_summary_delete AFTER DELETE ON projects BEGIN
+        UPDATE industry_summary SET
+            project_count = project_count - 1,
+            total_credits = total_credits - IFNULL(OLD.estimated_credits, 0),
+            total_output = total_output - IFNULL(OLD.output_tonnes, 0),
+            total_baseline = total_baseline - IFNULL(OLD.baseline_intensity, 0),
+            total_actual = total_actual - IFNULL(OLD.actual_emissions, 0),
+            total_leakage = total_leakage - IFNULL(OLD.leakage, 0)
+        WHERE industry = IFNULL(OLD.industry, '');
+        DELETE FROM industry_summary WHERE industry = IFNULL(OLD.industry, '') AND project_count <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS projects_summary_update AFTER UPDATE OF
+        industry, baseline_intensity, output_tonnes, actual_emissions, leakage, estimated_credits
+    ON projects BEGIN
+        UPDATE industry_summary SET
+            project_count = project_count - 1,
+            total_credits = total_credits - IFNULL(OLD.estimated_credits, 0),
+            total_output = total_output - IFNULL(OLD.output_tonnes, 0),
+            total_baseline = total_baseline - IFNULL(OLD.baseline_intensity, 0),
+            total_actual = total_actual - IFNULL(OLD.actual_emissions, 0),
+            total_leakage = total_leakage - IFNULL(OLD.leakage, 0)
+        WHERE industry = IFNULL(OLD.industry, '');
+        DELETE FROM industry_summary WHERE industry = IFNULL(OLD.industry, '') AND project_count <= 0;
+        INSERT INTO industry_summary VALUES (
+            IFNULL(NEW.industry, ''), 1, IFNULL(NEW.estimated_credits, 0), IFNULL(NEW.output_tonnes, 0),
+            IFNULL(NEW.baseline_intensity, 0), IFNULL(NEW.actual_emissions, 0), IFNULL(NEW.leakage, 0))
+        ON CONFLICT(industry) DO UPDATE SET
+            project_count = project_count + 1,
+            total_credits = total_credits + excluded.total_credits,
+            total_output = total_output + excluded.total_output,
+            total_baseline = total_baseline + excluded.total_baseline,
+            total_actual = total_actual + excluded.total_actual,
+            total_leakage = total_leakage + excluded.total_leakage;
+    END;
+    """,
+    # 3: factor revisions; each project records the revision its credits were computed with
+    """
+    ALTER TABLE projects ADD COLUMN factor_version INTEGER NOT NULL DEFAULT 0;
+    CREATE TABLE IF NOT EXISTS factor_versions (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        industry TEXT NOT NULL,
+        baseline_intensity REAL NOT NULL,
+        projects_updated INTEGER NOT NULL DEFAULT 0,
+        credits_before REAL NOT NULL DEFAULT 0,
+        credits_after REAL NOT NULL DEFAULT 0,
+        seconds REAL,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    """,
+    # 4: append-only change log. Inserts store the full row, updates only the changed
+    # columns, deletes nothing. ts is Unix time in seconds; project_id 0 marks
+    # registry-wide events such as factor revisions.
+    """
+    CREATE TABLE IF NOT EXISTS project_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id INTEGER NOT NULL,
+        ts REAL NOT NULL,
+        op TEXT NOT NULL,
+        delta TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_project_changes_project_ts ON project_changes(project_id, ts);
+    CREATE INDEX IF NOT EXISTS idx_project_changes_ts ON project_changes(ts);
+
+    CREATE TABLE IF NOT EXISTS registry_snapshots (
+        snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts REAL NOT NULL,
+        last_seq INTEGER NOT NULL,
+        projects INTEGER NOT NULL,
+        data BLOB NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_registry_snapshots_ts ON registry_snapshots(ts);
+
+    CREATE TRIGGER IF NOT EXISTS projects_audit_insert AFTER INSERT ON projects BEGIN
+        INSERT INTO project_changes (project_id, ts, op, delta) VALUES (
+            NEW.id, (julianday('now') - 2440587.5) * 86400.0, 'insert',
+            json_object('name', NEW.name, 'description', NEW.description, 'industry', NEW.industry,
+                        'baseline_intensity', NEW.baseline_intensity, 'output_tonnes', NEW.output_tonnes,
+                        'actual_emissions', NEW.actual_emissions, 'leakage', NEW.leakage,
+                        'estimated_credits', NEW.estimated_credits, 'factor_version', NEW.factor_version));
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS projects_audit_update AFTER UPDATE ON projects BEGIN
+        INSERT INTO project_changes (project_id, ts, op, delta)
+        SELECT NEW.id, (julianday('now') - 2440587.5) * 86400.0, 'update', json_group_object(k, v)
+        FROM (
+            SELECT 'name' AS k, NEW.name AS v WHERE NEW.name IS NOT OLD.name
+            UNION ALL SELECT 'description', NEW.description WHERE NEW.description IS NOT OLD.description
+            UNION ALL SELECT 'industry', NEW.industry WHERE NEW.industry IS NOT OLD.industry
+            UNION ALL SELECT 'baseline_intensity', NEW.baseline_intensity
+                WHERE NEW.baseline_intensity IS NOT OLD.baseline_intensity
+            UNION ALL SELECT 'output_tonnes', NEW.output_tonnes WHERE NEW.output_tonnes IS NOT OLD.output_tonnes
+            UNION ALL SELECT 'actual_emissions', NEW.actual_emissions
+                WHERE NEW.actual_emissions IS NOT OLD.actual_emissions
+            UNION ALL SELECT 'leakage', NEW.leakage WHERE NEW.leakage IS NOT OLD.leakage
+            UNION ALL SELECT 'estimated_credits', NEW.estimated_credits
+                WHERE NEW.estimated_credits IS NOT OLD.estimated_credits
+            UNION ALL SELECT 'factor_version', NEW.factor_version WHERE NEW.factor_version IS NOT OLD.factor_version
+        )
+        HAVING COUNT(*) > 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS projects_audit_delete AFTER DELETE ON projects BEGIN
+        INSERT INTO project_changes (project_id, ts, op, delta)
+        VALUES (OLD.id, (julianday('now') - 2440587.5) * 86400.0, 'delete', NULL);
+    END;
+    """,
+    # 5: keyset indexes for every listing sort, with and without the industry filter,
+    # so each page is an index range read instead of a scan plus sort
+    """
+    CREATE INDEX IF NOT EXISTS idx_projects_output ON projects(output_tonnes, id);
+    CREATE INDEX IF NOT EXISTS idx_projects_credits ON projects(estimated_credits, id);
+    CREATE INDEX IF NOT EXISTS idx_projects_industry_name ON projects(industry, name, id);
+    CREATE INDEX IF NOT EXISTS idx_projects_industry_output ON projects(industry, output_tonnes, id);
+    CREATE INDEX IF NOT EXISTS idx_projects_industry_credits ON projects(industry, estimated_credits, id);
+    ANALYZE projects;
+    """,
+]
+
+
+class RegistryDB:
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    # ---------- Connections ----------
+    def _open(self):
+        # Autocommit mode: transactions are opened explicitly in transaction()
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        # Borrow a pooled connection; blocks if every slot is in use
+        if not self._ready:
+            self.init_schema()
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                self._pool.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+        # queue on busy_timeout instead of failing with "database is locked"
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    # ---------- Schema ----------
+    def init_schema(self):
+        # Runs the pending migrations once per process; later calls return immediately
+        with self._init_lock:
+            if self._ready:
+                return
+            conn = self._open()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                    conn.executescript(f"BEGIN IMMEDIATE; {script} PRAGMA user_version={number}; COMMIT;")
+            finally:
+                conn.close()
+            self._ready = True
+
+    # ---------- Projects ----------
+    def insert_project(self, data):
+        with self.transaction() as conn:
+            cur = conn.execute("""
+            INSERT INTO projects
+            (name, description, industry, baseline_intensity, output_tonnes, actual_emissions, leakage, estimated_credits)
+            VALUES (?,?,?,?,?,?,?,?)
+            """, data)
+            return cur.lastrowid
+
+    def insert_projects(self, rows):
+        # Many rows (tuples in PROJECT_COLUMNS order) in one transaction
+        with self.transaction() as conn:
+            conn.executemany(f"""
+            INSERT INTO projects ({", ".join(PROJECT_COLUMNS)})
+            VALUES ({",".join("?" * len(PROJECT_COLUMNS))})
+            """, rows)
+
+    def iter_projects(self, batch_size=10_000):
+        # Every row in id order, batch_size rows at a time (keyset on id, no OFFSET scans)
+        last_id = 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute(f"""
+                    SELECT id, {", ".join(PROJECT_COLUMNS)} FROM projects
+                    WHERE id > ? ORDER BY id LIMIT ?
+                """, (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    def page_projects(self, sort="id", descending=False, industry=None, name_prefix=None,
+                      after=None, limit=50):
+        # One page of projects ordered by (sort, id). `after` is the (sort value, id) of
+        # the last row on the previous page, so every page is an index range, not an OFFSET.
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort}'. Choose from: {', '.join(SORT_COLUMNS)}")
+        where, params = _project_filters(industry, name_prefix)
+        if after is not None:
+            where.append(f"({sort}, id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        sql = f"""
+            SELECT id, {", ".join(PROJECT_COLUMNS)} FROM projects
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY {sort} {direction}, id {direction} LIMIT ?
+        """
+        with self.connection() as conn:
+            return conn.execute(sql, [*params, limit]).fetchall()
+
+    def count_projects(self, industry=None, name_prefix=None):
+        if not name_prefix:
+            # Served from the trigger-maintained summary, not a table scan
+            return sum(row["projects"] for row in self.industry_summary(industry))
+        where, params = _project_filters(industry, name_prefix)
+        with self.connection() as conn:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM projects {'WHERE ' + ' AND '.join(where) if where else ''}", params
+            ).fetchone()[0]
+
+    def industry_summary(self, industry=None):
+        # Per-industry count, totals and averages from industry_summary (one row per industry)
+        sql = "SELECT * FROM industry_summary"
+        params = ()
+        if industry:
+            sql += " WHERE industry = ?"
+            params = (industry,)
+        with self.connection() as conn:
+            rows = conn.execute(sql + " ORDER BY industry", params).fetchall()
+        return [
+            {
+                "industry": name,
+                "projects": count,
+                "total_credits": credits,
+                "total_output": output,
+                "avg_credits": credits / count,
+                "avg_baseline_intensity": baseline / count,
+                "avg_actual_emissions": actual / count,
+                "avg_leakage": leakage / count,
+            }
+            for name, count, credits, output, baseline, actual, leakage in rows
+            if count > 0
+        ]
+
+    def registry_totals(self):
+        # Whole-registry count, credit total and average, summed over the summary rows
+        summary = self.industry_summary()
+        projects = sum(row["projects"] for row in summary)
+        credits = sum(row["total_credits"] for row in summary)
+        return {
+            "projects": projects,
+            "total_credits": credits,
+            "avg_credits": credits / projects if projects else 0.0,
+        }
+
+    def rebuild_summaries(self):
+        # Recompute industry_summary from projects, e.g. to clear float drift after many edits
+        with self.transaction() as conn:
+            refresh_summary(conn)
+
+    def get_project(self, project_id):
+        with self.connection() as conn:
+            return conn.execute(f"SELECT id, {', '.join(PROJECT_COLUMNS)} FROM projects WHERE id=?",
+                                (project_id,)).fetchone()
+
+    def fetch_projects(self):
+        with self.connection() as conn:
+            return conn.execute(f"SELECT id, {', '.join(PROJECT_COLUMNS)} FROM projects").fetchall()
+
+    def update_project(self, project_id, name, description, industry, baseline, output, actual, leakage, credits):
+        with self.transaction() as conn:
+            conn.execute("""
+                UPDATE projects
+                SET name=?, description=?, industry=?, baseline_intensity=?, output_tonnes=?,
+                    actual_emissions=?, leakage=?, estimated_credits=?
+                WHERE id=?
+            """, (name, description, industry, baseline, output, actual, leakage, credits, project_id))
+
+    def delete_project(self, project_id):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM projects WHERE id=?", (project_id,))
+
+
+def refresh_summary(conn, industry=None):
+    # Rebuild industry_summary rows from projects (one industry, or all), inside the caller's transaction
+    if industry is None:
+        conn.execute("DELETE FROM industry_summary")
+        source, params = "projects", ()
+    else:
+        conn.execute("DELETE FROM industry_summary WHERE industry = ?", (industry,))
+        match = "industry = ?" if industry else "IFNULL(industry, '') = ?"
+        source, params = f"projects WHERE {match}", (industry,)
+    conn.execute(f"""
+        INSERT INTO industry_summary
+        SELECT IFNULL(industry, ''), COUNT(*), TOTAL(estimated_credits), TOTAL(output_tonnes),
+               TOTAL(baseline_intensity), TOTAL(actual_emissions), TOTAL(leakage)
+        FROM {source} GROUP BY IFNULL(industry, '')
+    """, params)
+
+
+@contextmanager
+def paused_trigger(conn, name):
+    # Drops a trigger for the rest of the block and recreates it afterwards. Only use inside
+    # a transaction: DDL is transactional in SQLite, so a rollback restores the trigger too.
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?", (name,)).fetchone()
+    if sql is None:
+        yield
+        return
+    conn.execute(f"DROP TRIGGER {name}")
+    yield
+    conn.execute(sql[0])
+
+
+def _project_filters(industry, name_prefix):
+    where, params = [], []
+    if industry:
+        where.append("industry = ?")
+        params.append(industry)
+    if name_prefix:
+        # Escape LIKE wildcards so the prefix is matched literally
+        escaped = name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append("name LIKE ? ESCAPE '\\'")
+        params.append(escaped + "%")
+    return where, params
+
+
+# Shared by every session in the process
+REGISTRY = RegistryDB()
+
+
+# Module-level API kept for the pages
+def init_db():
+    REGISTRY.init_schema()
 
 def insert_project(data):
-    conn = sqlite3.connect("registry.db")
-    c = conn.cursor()
-    c.execute("""
-    INSERT INTO projects
-    (name, description, industry, baseline_intensity, output_tonnes, actual_emissions, leakage, estimated_credits)
-    VALUES (?,?,?,?,?,?,?,?)
-    """, data)
-    conn.commit()
-    conn.close()
+    return REGISTRY.insert_project(data)
+
+def insert_projects(rows):
+    REGISTRY.insert_projects(rows)
 
 def fetch_projects():
-    conn = sqlite3.connect("registry.db")
-    c = conn.cursor()
-    c.execute("SELECT * FROM projects")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    return REGISTRY.fetch_projects()
+
+def page_projects(sort="id", descending=False, industry=None, name_prefix=None, after=None, limit=50):
+    return REGISTRY.page_projects(sort, descending, industry, name_prefix, after, limit)
+
+def count_projects(industry=None, name_prefix=None):
+    return REGISTRY.count_projects(industry, name_prefix)
+
+def get_project(project_id):
+    return REGISTRY.get_project(project_id)
+
+def industry_summary(industry=None):
+    return REGISTRY.industry_summary(industry)
+
+def registry_totals():
+    return REGISTRY.registry_totals()
 
 def update_project(project_id, name, description, industry, baseline, output, actual, leakage, credits):
-    conn = sqlite3.connect("registry.db")
-    c = conn.cursor()
-    c.execute("""
-        UPDATE projects
-        SET name=?, description=?, industry=?, baseline_intensity=?, output_tonnes=?,
-            actual_emissions=?, leakage=?, estimated_credits=?
-        WHERE id=?
-    """, (name, description, industry, baseline, output, actual, leakage, credits, project_id))
-    conn.commit()
-    conn.close()
+    REGISTRY.update_project(project_id, name, description, industry, baseline, output, actual, leakage, credits)
 
 def delete_project(project_id):
-    conn = sqlite3.connect("registry.db")
-    c = conn.cursor()
-    c.execute("DELETE FROM projects WHERE id=?", (project_id,))
-    conn.commit()
-    conn.close()
-
+    REGISTRY.delete_project(project_id)
@@ -0,0 +1,138 @@
+import io
+import os
+
+import pandas as pd
+
+from registry_db import INDUSTRIES, PROJECT_COLUMNS, REGISTRY
+
+# ========================
+# Bulk import / export for the project registry.
+# Files are read in chunks, validated and credited with vectorized pandas
+# operations, then written with executemany, one transaction per batch.
+# Exports stream keyset batches straight to the output file.
+# ========================
+BATCH_SIZE = 10_000
+FORMATS = ("csv", "parquet", "jsonl")
+NUMERIC_COLUMNS = ["baseline_intensity", "output_tonnes", "actual_emissions", "leakage"]
+REQUIRED_COLUMNS = ["name", "industry", *NUMERIC_COLUMNS]
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename)[1].lower().lstrip(".")
+    fmt = {"ndjson": "jsonl", "json": "jsonl", "pq": "parquet"}.get(ext, ext)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported file type '.{ext}'. Use one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+def read_chunks(source, fmt, batch_size=BATCH_SIZE):
+    # Yields DataFrames of at most batch_size rows; source is a path or file-like object
+    if fmt == "csv":
+        yield from pd.read_csv(source, chunksize=batch_size)
+    elif fmt == "jsonl":
+        yield from pd.read_json(source, lines=True, chunksize=batch_size)
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+
+
+def estimated_credits(baseline, output, actual, leakage):
+    # Same formula as the project form, on scalars or whole columns
+    return baseline * output - actual - leakage
+
+
+def validate_chunk(df):
+    # Returns (rows ready to insert in PROJECT_COLUMNS order, number of rejected rows).
+    # Rows need a name, a known industry and non-negative numeric inputs;
+    # estimated_credits is always recomputed rather than trusted from the file.
+    df = df.rename(columns=str.lower)
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    numbers = df[NUMERIC_COLUMNS].apply(pd.to_numeric, errors="coerce")
+    name = df["name"].astype("string").str.strip()
+    valid = (
+        name.notna() & (name != "")
+        & df["industry"].isin(INDUSTRIES)
+        & numbers.notna().all(axis=1)
+        & (numbers >= 0).all(axis=1)
+    ).to_numpy()
+
+    description = df["description"] if "description" in df.columns else pd.Series("", index=df.index)
+    clean = pd.DataFrame({
+        "name": name,
+        "description": description.fillna("").astype(str),
+        "industry": df["industry"],
+        **numbers,
+    })[valid]
+    clean["estimated_credits"] = estimated_credits(
+        clean["baseline_intensity"], clean["output_tonnes"], clean["actual_emissions"], clean["leakage"]
+    )
+    # Plain Python objects for sqlite3
+    clean = clean[PROJECT_COLUMNS].astype(object)
+    return list(clean.itertuples(index=False, name=None)), int((~valid).sum())
+
+
+def import_projects(source, fmt=None, batch_size=BATCH_SIZE, registry=REGISTRY):
+    # Returns {"inserted": n, "rejected": n}
+    fmt = fmt or detect_format(getattr(source, "name", str(source)))
+    inserted = rejected = 0
+    for chunk in read_chunks(source, fmt, batch_size):
+        rows, bad = validate_chunk(chunk)
+        if rows:
+            registry.insert_projects(rows)
+        inserted += len(rows)
+        rejected += bad
+    return {"inserted": inserted, "rejected": rejected}
+
+
+def export_projects(dest, fmt, batch_size=BATCH_SIZE, registry=REGISTRY):
+    # Writes every project to dest (path or binary file-like), one batch in memory at a time
+    columns = ["id", *PROJECT_COLUMNS]
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for rows in registry.iter_projects(batch_size):
+                table = pa.Table.from_pandas(pd.DataFrame(rows, columns=columns), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(dest, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            pq.write_table(pa.Table.from_pandas(pd.DataFrame(columns=columns)), dest)
+        return
+
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    own = isinstance(dest, (str, os.PathLike))
+    out = open(dest, "wb") if own else dest
+    try:
+        header = True
+        for rows in registry.iter_projects(batch_size):
+            frame = pd.DataFrame(rows, columns=columns)
+            if fmt == "csv":
+                chunk = frame.to_csv(header=header, index=False, lineterminator="\n")
+            else:
+                chunk = frame.to_json(orient="records", lines=True)
+            out.write(chunk.encode("utf-8"))
+            header = False
+        if header and fmt == "csv":
+            out.write((",".join(columns) + "\n").encode("utf-8"))
+    finally:
+        if own:
+            out.close()
+
+
+def export_bytes(fmt, batch_size=BATCH_SIZE, registry=REGISTRY):
+    # Whole export as bytes, for st.download_button
+    buffer = io.BytesIO()
+    export_projects(buffer, fmt, batch_size, registry)
+    return buffer.getvalue()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# ========================
+# Content-addressed cache for dicts of NumPy arrays.
+# Memory tier: LRU with a size cap in MB, shared by every session in the process.
+# Disk tier (optional): one .npz per key, so results survive a restart.
+# ========================
+
+
+def make_key(**params):
+    # Stable hash of the inputs; tuples and numpy scalars serialise like lists and floats
+    payload = json.dumps(params, sort_keys=True, default=float)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _nbytes(value):
+    return sum(np.asarray(v).nbytes for v in value.values())
+
+
+class ResultCache:
+    def __init__(self, max_mb=256, disk_dir=None, disk_max_mb=1024):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = int(disk_max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        value = self._load(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        self._store(key, value)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ---------- Memory tier ----------
+    def _remember(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return  # never evict everything for one oversized entry
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            while self._entries and self._bytes + size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+    # ---------- Disk tier ----------
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _load(self, key):
+        if not self.disk_dir or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with np.load(self._path(key)) as data:
+                value = {k: (v.item() if v.ndim == 0 else v) for k, v in data.items()}
+        except (OSError, ValueError):
+            return None  # unreadable or half-written file: treat as a miss
+        try:
+            os.utime(self._path(key))  # keep recently used files on disk longest
+        except FileNotFoundError:
+            pass
+        return value
+
+    def _store(self, key, value):
+        if not self.disk_dir:
+            return
+        # Write to a temp file and rename, so readers never see a partial file
+        tmp = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **value)
+        os.replace(tmp, self._path(key))
+        self._prune_disk()
+
+    def _prune_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                continue  # removed by another process
+            entries.append((info.st_mtime, info.st_size, path))
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.disk_max_bytes:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
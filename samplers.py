@@ -0,0 +1,52 @@
+import warnings
+
+import numpy as np
+from scipy.stats import qmc
+
+# ========================
+# Samplers for the Monte Carlo inputs. Each one fills the unit hypercube;
+# scale_to_ranges maps the points onto the user's input ranges.
+# ========================
+
+
+def pseudo_random(rng, n, dims):
+    return rng.random((n, dims))
+
+
+def latin_hypercube(rng, n, dims):
+    # One point in each of n equal-width strata per dimension, strata shuffled per column
+    strata = rng.permuted(np.tile(np.arange(n), (dims, 1)), axis=1).T
+    return (strata + rng.random((n, dims))) / n
+
+
+def sobol(rng, n, dims):
+    # Owen-scrambled Sobol points. Balance is best at powers of two but any n works.
+    engine = qmc.Sobol(dims, scramble=True, seed=rng)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # "balance properties" warning for non powers of two
+        return engine.random(n)
+
+
+SAMPLERS = {
+    "random": pseudo_random,
+    "lhs": latin_hypercube,
+    "sobol": sobol,
+}
+
+SAMPLER_LABELS = {
+    "random": "Pseudo-random",
+    "lhs": "Latin hypercube",
+    "sobol": "Sobol (scrambled)",
+}
+
+
+def sample_unit(sampler, rng, n, dims):
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Unknown sampler '{sampler}'. Choose from: {', '.join(SAMPLERS)}")
+    return SAMPLERS[sampler](rng, n, dims)
+
+
+def scale_to_ranges(unit, ranges):
+    lo = np.array([r[0] for r in ranges], dtype=float)
+    hi = np.array([r[1] for r in ranges], dtype=float)
+    return lo + unit * (hi - lo)
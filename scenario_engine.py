@@ -0,0 +1,32 @@
+import numpy as np
+
+# ========================
+# Scenario trajectory engine.
+# Each scenario moves linearly from a common starting value to its own target
+# across the periods it covers. Paths are built once per (scenario, period)
+# pair and attached to the long-format frame with a single merge.
+# ========================
+
+
+def trajectories(df, targets, start, scenario_col="Scenario", period_col="Period", value_col="Value"):
+    # One row per (scenario, period) with the value on that scenario's path.
+    # Scenarios without a target (e.g. Historical) stay at `start`.
+    pairs = (
+        df[[scenario_col, period_col]]
+        .drop_duplicates()
+        .sort_values([scenario_col, period_col], kind="stable")
+        .reset_index(drop=True)
+    )
+    grouped = pairs.groupby(scenario_col, sort=False)[period_col]
+    step = grouped.cumcount().to_numpy()
+    steps = grouped.transform("size").to_numpy() - 1
+    progress = np.divide(step, steps, out=np.zeros(len(pairs)), where=steps > 0)
+
+    target = pairs[scenario_col].map(targets).fillna(start).to_numpy(dtype=float)
+    pairs[value_col] = start + (target - start) * progress
+    return pairs
+
+
+def attach_trajectories(df, targets, start, scenario_col="Scenario", period_col="Period", value_col="Value"):
+    paths = trajectories(df, targets, start, scenario_col, period_col, value_col)
+    return df.drop(columns=[value_col], errors="ignore").merge(paths, on=[scenario_col, period_col], how="left")
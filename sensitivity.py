@@ -0,0 +1,74 @@
+import numpy as np
+
+from samplers import sample_unit
+
+# ========================
+# Variance-based global sensitivity (Sobol indices), Saltelli scheme.
+# The model takes an (n, dims) array of points in the unit hypercube and
+# returns n outputs, so it is evaluated in large vectorized batches.
+# ========================
+DEFAULT_BATCH_SIZE = 250_000
+
+
+def _evaluate(model, points, batch_size):
+    return np.concatenate([model(points[i:i + batch_size]) for i in range(0, len(points), batch_size)])
+
+
+def _row_terms(f_a, f_b, f_ab):
+    # Per-row terms whose column means determine every index, so bootstrap
+    # resamples reduce to re-weighted means (one matrix product per batch)
+    centre = np.mean(np.concatenate([f_a, f_b]))
+    f_a, f_b, f_ab = f_a - centre, f_b - centre, f_ab - centre
+    return np.column_stack([
+        f_a, f_b, f_a ** 2, f_b ** 2,
+        (f_b * (f_ab - f_a)).T,      # first order: Saltelli (2010)
+        0.5 * ((f_a - f_ab) ** 2).T,  # total effect: Jansen (1999)
+    ])
+
+
+def _indices(means, dims):
+    # means: (..., 4 + 2 * dims) column means of _row_terms
+    mean_f = (means[..., 0] + means[..., 1]) / 2
+    variance = (means[..., 2] + means[..., 3]) / 2 - mean_f ** 2
+    first = means[..., 4:4 + dims] / variance[..., None]
+    total = means[..., 4 + dims:] / variance[..., None]
+    return first, total
+
+
+def sobol_indices(model, dims, n, rng, sampler="random", bootstrap=200, confidence=0.95,
+                  batch_size=DEFAULT_BATCH_SIZE):
+    # n base samples cost n * (dims + 2) model evaluations.
+    # Returns first-order and total-effect indices with bootstrap confidence intervals.
+    base = sample_unit(sampler, rng, n, 2 * dims)
+    a, b = base[:, :dims], base[:, dims:]
+
+    # A with column i taken from B, for every i, stacked into one batch
+    ab = np.repeat(a[None, :, :], dims, axis=0)
+    ab[np.arange(dims), :, np.arange(dims)] = b.T
+
+    f_a = _evaluate(model, a, batch_size)
+    f_b = _evaluate(model, b, batch_size)
+    f_ab = _evaluate(model, ab.reshape(dims * n, dims), batch_size).reshape(dims, n)
+    terms = _row_terms(f_a, f_b, f_ab)
+    first, total = _indices(terms.mean(axis=0), dims)
+
+    # Bootstrap over base-sample rows: each resample is a vector of row counts,
+    # a few resamples at a time to bound memory
+    boot_means = []
+    per_batch = max(1, batch_size // n)
+    for start in range(0, bootstrap, per_batch):
+        rows = rng.integers(0, n, size=(min(per_batch, bootstrap - start), n))
+        counts = np.stack([np.bincount(r, minlength=n) for r in rows]).astype(float)
+        boot_means.append(counts @ terms / n)
+    boot_first, boot_total = _indices(np.concatenate(boot_means), dims)
+    alpha = (1 - confidence) / 2
+    first_ci = np.quantile(boot_first, [alpha, 1 - alpha], axis=0)
+    total_ci = np.quantile(boot_total, [alpha, 1 - alpha], axis=0)
+
+    return {
+        "first_order": first,
+        "first_order_ci": first_ci.T,
+        "total_effect": total,
+        "total_effect_ci": total_ci.T,
+        "evaluations": n * (dims + 2),
+    }